@@ -78,10 +78,65 @@ static const char *_dm_task_type_names[] = {
     "DM_DEVICE_SET_GEOMETRY"
 };
 
+/*
+ * Return the C string value and length of a single string argument passed
+ * to a METH_O method, without building and parsing an argument tuple.
+ * Raises TypeError (for non-string arguments, including None) or
+ * ValueError (for strings with embedded NUL characters) and returns NULL
+ * on error.
+ */
+static const char *
+_dmpy_str_arg(PyObject *arg, const char *method, Py_ssize_t *len)
+{
+    const char *str;
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyUnicode_Check(arg)) {
+        PyErr_Format(PyExc_TypeError, "%s() argument must be str, not %.50s",
+                     method, Py_TYPE(arg)->tp_name);
+        return NULL;
+    }
+    if (!(str = PyUnicode_AsUTF8AndSize(arg, len)))
+        return NULL;
+#else
+    if (PyString_AsStringAndSize(arg, (char **) &str, len) < 0)
+        return NULL;
+#endif
+
+    if (strlen(str) != (size_t) *len) {
+        PyErr_Format(PyExc_ValueError, "%s() argument contains an embedded "
+                     "null character.", method);
+        return NULL;
+    }
+    return str;
+}
+
 /* Dm objects */
 
 static PyObject *DmErrorObject;
 
+/*
+ * DmTask.run() issues its ioctl without holding the GIL. The libdm
+ * control file descriptor, ioctl setup, node operations, udev cookies and
+ * library settings are process wide and are not thread safe, so every
+ * call into libdm that touches that state is serialised by this lock
+ * instead. Calls that only read or write a single dm_task or dm_stats
+ * handle owned by one Python object are not locked.
+ */
+static PyThread_type_lock _dmpy_run_lock = NULL;
+
+/*
+ * Drop the GIL and take the run lock around a libdm call. The run lock
+ * must only be taken after releasing the GIL to avoid deadlock.
+ */
+#define DMPY_BEGIN_LIBDM_CALL \
+    Py_BEGIN_ALLOW_THREADS \
+    PyThread_acquire_lock(_dmpy_run_lock, WAIT_LOCK);
+
+#define DMPY_END_LIBDM_CALL \
+    PyThread_release_lock(_dmpy_run_lock); \
+    Py_END_ALLOW_THREADS
+
 
 typedef struct {
     PyObject_HEAD
@@ -254,6 +309,7 @@ typedef struct {
     uint16_t ck_val_prefix;
     uint16_t ck_val_base;
     PyObject *ck_ready; /* Py_True / Py_False */
+    int ck_waiting; /* udev_wait() in progress with the GIL released */
 } DmCookieObject;
 
 static PyTypeObject DmCookie_Type;
@@ -297,6 +353,7 @@ _DmCookie_init(DmCookieObject *self, uint32_t value)
 
     Py_INCREF(Py_False);
     self->ck_ready = Py_False;
+    self->ck_waiting = 0;
 
     return 0;
 }
@@ -386,7 +443,11 @@ DmCookie_udev_complete(DmCookieObject *self, PyObject *args)
 {
     PyObject *ret;
     int r;
+
+    DMPY_BEGIN_LIBDM_CALL
     r = dm_udev_complete(self->ck_cookie);
+    DMPY_END_LIBDM_CALL
+
     ret = (r) ? Py_True : Py_False;
     Py_INCREF(ret);
     return ret;
@@ -404,11 +465,23 @@ _DmCookie_udev_wait(DmCookieObject *self, int immediate)
         return NULL;
     }
 
+    /* Another thread may complete the cookie once the GIL is dropped. */
+    if (self->ck_waiting) {
+        PyErr_SetString(PyExc_ValueError, "Cannot udev_wait() on a "
+                        "DmCookie that is already being waited on.");
+        return NULL;
+    }
+    self->ck_waiting = 1;
+
+    DMPY_BEGIN_LIBDM_CALL
     if (!immediate) {
         r = dm_udev_wait(self->ck_cookie);
         ready = r;
     } else
         r = dm_udev_wait_immediate(self->ck_cookie, &ready);
+    DMPY_END_LIBDM_CALL
+
+    self->ck_waiting = 0;
 
     ret = (r) ? Py_True : Py_False;
     Py_INCREF(ret);
@@ -678,7 +751,7 @@ static const uint32_t _DmTask_task_type_flags[] = {
     (DMT_HAVE_IDENTITY | DMT_HAVE_DEPS),  /*DEPS */
     DMT_HAVE_IDENTITY,  /* RENAME */
     0,  /* VERSION */
-    DMT_HAVE_IDENTITY,  /* STATUS */
+    (DMT_HAVE_IDENTITY | DMT_HAVE_STATUS),  /* STATUS */
     (DMT_HAVE_IDENTITY | DMT_HAVE_TABLE),  /* TABLE */
     DMT_HAVE_IDENTITY,  /* WAITEVENT */
     DMT_HAVE_NAME_LIST,  /* LIST */
@@ -720,13 +793,16 @@ static PyTypeObject DmTask_Type;
 #define DmTaskObject_Check(v)      (Py_TYPE(v) == &DmTask_Type)
 
 /*
- * Check whether an ioctl has been performed, and whether `flag` is present
- * in `self->tk_flags`, and raise TypeError if either condition is not met.
+ * Check whether an ioctl has been performed, and whether any of the bits in
+ * `flag` is present in `self->tk_flags`, and raise TypeError if either
+ * condition is not met.
  */
 static int
 _DmTask_check_data_flags(DmTaskObject *self, uint32_t flag, char *method)
 {
-    int flag_index = 0;
+    char desc[128] = "";
+    size_t len = 0;
+    int flag_index;
 
     if (!(self->tk_flags & DMT_DID_IOCTL)) {
         PyErr_Format(PyExc_TypeError, "DmTask(%s).%s requires ioctl data.",
@@ -735,33 +811,43 @@ _DmTask_check_data_flags(DmTaskObject *self, uint32_t flag, char *method)
     }
 
     if (!(self->tk_flags & flag)) {
-        while (flag >>= 1)
-            flag_index++;
+        /* Name every kind of data that would have satisfied the check. */
+        for (flag_index = 0; (flag >> flag_index) && len < sizeof(desc);
+             flag_index++) {
+            if (!(flag & (1U << flag_index)))
+                continue;
+            len += snprintf(desc + len, sizeof(desc) - len, "%s%s",
+                            (len) ? " or " : "",
+                            _DmTask_flag_strings[flag_index]);
+        }
         PyErr_Format(PyExc_TypeError, "DmTask(%s) does not provide "
-                     "%s data.", _dm_task_type_names[self->tk_type],
-                     _DmTask_flag_strings[flag_index]);
+                     "%s data.", _dm_task_type_names[self->tk_type], desc);
         return -1;
     }
     return 0;
 }
 
+/*
+ * Create the dm_task for a new DmTaskObject of DM_DEVICE_* `type`: shared
+ * by DmTask.__init__() and DmTask.create_many().
+ */
 static int
-DmTask_init(DmTaskObject *self, PyObject *args, PyObject *kwds)
+_DmTask_setup(DmTaskObject *self, long type)
 {
-    int type;
-
-    if (!PyArg_ParseTuple(args, "i:__init__", &type))
-        return -1;
-
     self->ck_cookie = NULL;
     self->tk_flags = 0;
 
     if (type < 0 || type > DM_DEVICE_SET_GEOMETRY) {
-        PyErr_Format(PyExc_TypeError, "Invalid DmTask type: %d", type);
+        PyErr_Format(PyExc_TypeError, "Invalid DmTask type: %ld", type);
         return -1;
     }
 
-    if (!(self->tk_dmt = dm_task_create(type))) {
+    /* The first task created checks the driver version with an ioctl. */
+    DMPY_BEGIN_LIBDM_CALL
+    self->tk_dmt = dm_task_create(type);
+    DMPY_END_LIBDM_CALL
+
+    if (!self->tk_dmt) {
         /* FIXME: use dm_task_get_errno */
         PyErr_SetFromErrno(PyExc_OSError);
         return -1;
@@ -776,7 +862,7 @@ DmTask_init(DmTaskObject *self, PyObject *args, PyObject *kwds)
      * we know the type that was requested, in order to have the correct
      * expectations for which fields will be valid in the response.
      */
-    self->tk_type = type;
+    self->tk_type = (int) type;
     self->tk_flags = 0;
 
     if (!dm_task_enable_checks(self->tk_dmt)) {
@@ -787,6 +873,80 @@ DmTask_init(DmTaskObject *self, PyObject *args, PyObject *kwds)
     return 0;
 }
 
+static int
+DmTask_init(DmTaskObject *self, PyObject *args, PyObject *kwds)
+{
+    int type;
+
+    if (!PyArg_ParseTuple(args, "i:__init__", &type))
+        return -1;
+
+    return _DmTask_setup(self, type);
+}
+
+static PyObject *
+DmTask_create_many(PyTypeObject *type, PyObject *types)
+{
+    PyObject *seq, *list = NULL, *dmt;
+    Py_ssize_t i, len;
+    long *ttypes = NULL;
+
+    if (!(seq = PySequence_Fast(types, "create_many() argument must be "
+                                "iterable.")))
+        return NULL;
+
+    len = PySequence_Fast_GET_SIZE(seq);
+    if (!(ttypes = PyMem_New(long, len ? len : 1))) {
+        PyErr_NoMemory();
+        goto fail;
+    }
+
+    /* Check every type before creating any task. */
+    for (i = 0; i < len; i++) {
+        ttypes[i] = PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+        if (ttypes[i] == -1 && PyErr_Occurred())
+            goto fail;
+        if (ttypes[i] < 0 || ttypes[i] > DM_DEVICE_SET_GEOMETRY) {
+            PyErr_Format(PyExc_TypeError, "Invalid DmTask type: %ld",
+                         ttypes[i]);
+            goto fail;
+        }
+    }
+
+    if (!(list = PyList_New(len)))
+        goto fail;
+
+    for (i = 0; i < len; i++) {
+        /* Subclasses may override __init__(): call the type for them. */
+        if (type != &DmTask_Type) {
+            if (!(dmt = PyObject_CallFunction((PyObject *) type, "l",
+                                              ttypes[i])))
+                goto fail;
+            PyList_SET_ITEM(list, i, dmt);
+            continue;
+        }
+
+        if (!(dmt = type->tp_alloc(type, 0)))
+            goto fail;
+
+        /* The list owns the new task, even if it is not fully set up. */
+        PyList_SET_ITEM(list, i, dmt);
+        if (_DmTask_setup((DmTaskObject *) dmt, ttypes[i]))
+            goto fail;
+    }
+
+    PyMem_Free(ttypes);
+    Py_DECREF(seq);
+    return list;
+
+fail:
+    /* Release any tasks already created: the call creates all or none. */
+    Py_XDECREF(list);
+    PyMem_Free(ttypes);
+    Py_DECREF(seq);
+    return NULL;
+}
+
 static void
 DmTask_dealloc(DmTaskObject *self)
 {
@@ -794,9 +954,10 @@ DmTask_dealloc(DmTaskObject *self)
         dm_task_destroy(self->tk_dmt);
     self->tk_dmt = NULL;
 
-    Py_XDECREF(self->ck_cookie);
+    Py_CLEAR(self->ck_cookie);
 
-    PyObject_Del(self);
+    /* Subclass instances come from the GC allocator: free them in kind. */
+    Py_TYPE(self)->tp_free((PyObject *) self);
 }
 
 /* DmTask methods */
@@ -838,12 +999,19 @@ DmTask_set_uuid(DmTaskObject *self, PyObject *args)
 static PyObject *
 DmTask_run(DmTaskObject *self, PyObject *args)
 {
+    int r, err = 0;
+
     /* DMT_DID_IOCTL does not imply success. */
     self->tk_flags |= DMT_DID_IOCTL;
 
-    if (!(dm_task_run(self->tk_dmt))) {
+    DMPY_BEGIN_LIBDM_CALL
+    if (!(r = dm_task_run(self->tk_dmt)))
+        err = dm_task_get_errno(self->tk_dmt);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         self->tk_flags |= DMT_DID_ERROR;
-        errno = dm_task_get_errno(self->tk_dmt);
+        errno = err;
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
@@ -962,6 +1130,46 @@ DmTask_get_deps(DmTaskObject *self, PyObject *args)
     return _dm_build_deps_list(deps);
 }
 
+static PyObject *
+DmTask_get_targets(DmTaskObject *self, PyObject *args)
+{
+    PyObject *target_list = NULL, *target;
+    uint64_t start, length;
+    char *target_type, *params;
+    void *next = NULL;
+
+    if (_DmTask_check_data_flags(self, DMT_HAVE_TABLE | DMT_HAVE_STATUS,
+                                 "get_targets"))
+        return NULL;
+
+    if (!(target_list = PyList_New(0)))
+        return NULL;
+
+    do {
+        next = dm_get_next_target(self->tk_dmt, next, &start, &length,
+                                  &target_type, &params);
+        /* A device with no table returns a single NULL target type. */
+        if (!target_type)
+            continue;
+        target = Py_BuildValue("(KKss)", (unsigned long long) start,
+                               (unsigned long long) length, target_type,
+                               params ? params : "");
+        if (!target)
+            goto fail;
+        if (PyList_Append(target_list, target) < 0) {
+            Py_DECREF(target);
+            goto fail;
+        }
+        Py_DECREF(target);
+    } while (next);
+
+    return target_list;
+
+fail:
+    Py_DECREF(target_list);
+    return NULL;
+}
+
 static PyObject *
 _DmTask_build_versions_dict(struct dm_versions *target)
 {
@@ -1064,30 +1272,56 @@ DmTask_get_name(DmTaskObject *self, PyObject *args, PyObject *kwds)
     return Py_BuildValue("s", name);
 }
 
+/*
+ * Walk a dm_names list once to count the entries and, optionally, the
+ * total length of the names including their terminating NULs.
+ */
+static Py_ssize_t
+_DmTask_count_names(struct dm_names *names, Py_ssize_t *names_len)
+{
+    Py_ssize_t nr_names = 0, len = 0;
+    unsigned next = 0;
+
+    do {
+        names = (struct dm_names *)((char *) names + next);
+        len += strlen(names->name) + 1;
+        nr_names++;
+        next = names->next;
+    } while (next);
+
+    if (names_len)
+        *names_len = len;
+    return nr_names;
+}
+
 static PyObject *
 _DmTask_build_name_list(struct dm_names *names)
 {
-    PyObject *name_list = NULL;
+    PyObject *name_list = NULL, *name;
+    Py_ssize_t i, nr_names;
     unsigned next = 0;
 
     if (!names->name) {
         PyErr_SetString(PyExc_OSError, "Received empty device list from "
                         "device-mapper");
-        goto fail;
+        return NULL;
     }
 
-    if (!(name_list = PyList_New(0)))
+    nr_names = _DmTask_count_names(names, NULL);
+    if (!(name_list = PyList_New(nr_names)))
         return NULL;
 
-    do {
+    for (i = 0; i < nr_names; i++) {
         names = (struct dm_names *)((char *) names + next);
-        PyList_Append(name_list, Py_BuildValue("(sii)", names->name,
-                                               MAJOR(names->dev),
-                                               MINOR(names->dev)));
+        name = Py_BuildValue("(sii)", names->name, MAJOR(names->dev),
+                             MINOR(names->dev));
+        if (!name)
+            goto fail;
+        PyList_SET_ITEM(name_list, i, name);
         next = names->next;
-    } while (next);
+    }
 
-    return name_list;        
+    return name_list;
 
 fail:
     Py_DECREF(name_list);
@@ -1110,6 +1344,110 @@ DmTask_get_names(DmTaskObject *self, PyObject *args)
     return _DmTask_build_name_list(names);
 }
 
+/*
+ * Return an `array.array` of unsigned int built from the bytes object
+ * `buf`, stealing the reference to `buf`. memoryview.cast() is not
+ * available on Python 2.7, but the array type is.
+ */
+static PyObject *
+_dmpy_uint_array(PyObject *buf)
+{
+    PyObject *array_mod, *array;
+
+    if (!(array_mod = PyImport_ImportModule("array"))) {
+        Py_DECREF(buf);
+        return NULL;
+    }
+
+    array = PyObject_CallMethod(array_mod, "array", "sO", "I", buf);
+    Py_DECREF(array_mod);
+    Py_DECREF(buf);
+    return array;
+}
+
+static PyObject *
+_DmTask_build_name_buffer(struct dm_names *names)
+{
+    PyObject *name_buf = NULL, *major_buf = NULL, *minor_buf = NULL;
+    PyObject *major_array = NULL, *minor_array = NULL, *buffer;
+    unsigned int *majors, *minors;
+    Py_ssize_t i, nr_names, names_len;
+    unsigned next = 0;
+    char *name_p;
+    size_t len;
+
+    /* An empty device list is a single entry with a zero dev_t. */
+    if (names->dev)
+        nr_names = _DmTask_count_names(names, &names_len);
+    else
+        nr_names = names_len = 0;
+
+    name_buf = PyBytes_FromStringAndSize(NULL, names_len);
+    major_buf = PyBytes_FromStringAndSize(NULL,
+                                          nr_names * sizeof(*majors));
+    minor_buf = PyBytes_FromStringAndSize(NULL,
+                                          nr_names * sizeof(*minors));
+    if (!name_buf || !major_buf || !minor_buf)
+        goto fail;
+
+    name_p = PyBytes_AS_STRING(name_buf);
+    majors = (unsigned int *) PyBytes_AS_STRING(major_buf);
+    minors = (unsigned int *) PyBytes_AS_STRING(minor_buf);
+
+    for (i = 0; i < nr_names; i++) {
+        names = (struct dm_names *)((char *) names + next);
+        len = strlen(names->name) + 1;
+        memcpy(name_p, names->name, len);
+        name_p += len;
+        majors[i] = MAJOR(names->dev);
+        minors[i] = MINOR(names->dev);
+        next = names->next;
+    }
+
+    /* _dmpy_uint_array() steals the column buffer references. */
+    major_array = _dmpy_uint_array(major_buf);
+    major_buf = NULL;
+    if (!major_array)
+        goto fail;
+
+    minor_array = _dmpy_uint_array(minor_buf);
+    minor_buf = NULL;
+    if (!minor_array)
+        goto fail;
+
+    buffer = Py_BuildValue("(NNN)", name_buf, major_array, minor_array);
+    if (!buffer)
+        /* Py_BuildValue() consumes the "N" references on failure. */
+        return NULL;
+
+    return buffer;
+
+fail:
+    Py_XDECREF(name_buf);
+    Py_XDECREF(major_buf);
+    Py_XDECREF(minor_buf);
+    Py_XDECREF(major_array);
+    Py_XDECREF(minor_array);
+    return NULL;
+}
+
+static PyObject *
+DmTask_get_names_buffer(DmTaskObject *self, PyObject *args)
+{
+    struct dm_names *names = NULL;
+
+    if (_DmTask_check_data_flags(self, DMT_HAVE_NAME_LIST,
+                                 "get_names_buffer"))
+        return NULL;
+
+    if (!(names = dm_task_get_names(self->tk_dmt))) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    return _DmTask_build_name_buffer(names);
+}
+
 static PyObject *
 DmTask_set_ro(DmTaskObject *self, PyObject *args)
 {
@@ -1119,26 +1457,27 @@ DmTask_set_ro(DmTaskObject *self, PyObject *args)
 }
 
 static PyObject *
-DmTask_set_newname(DmTaskObject *self, PyObject *args)
+DmTask_set_newname(DmTaskObject *self, PyObject *arg)
 {
-    char *newname;
+    const char *newname;
+    Py_ssize_t len;
 
-    if (!PyArg_ParseTuple(args, "s:set_newname", &newname))
+    if (!(newname = _dmpy_str_arg(arg, "set_newname", &len)))
         goto fail;
 
     /* repeat the libdm validation so that a meaningful error is given. */
-    if (strchr(newname, '/')) {
+    if (memchr(newname, '/', len)) {
         PyErr_Format(PyExc_ValueError, "Name \"%s\" invalid. It contains "
                      "\"/\".", newname);
         goto fail;
     }
 
-    if (strlen(newname) >= DM_NAME_LEN) {
+    if (len >= DM_NAME_LEN) {
         PyErr_Format(PyExc_ValueError, "Name \"%s\" too long.", newname);
         goto fail;
     }
 
-    if (!*newname) {
+    if (!len) {
         PyErr_SetString(PyExc_ValueError, "Non empty new name is required.");
         goto fail;
     }
@@ -1308,6 +1647,7 @@ DmTask_set_cookie(DmTaskObject *self, PyObject *args)
 {
     DmCookieObject *cookie = NULL;
     uint16_t flags = 0;
+    int r;
 
     if (!PyArg_ParseTuple(args, "O!:set_cookie", &DmCookie_Type, &cookie))
         return NULL;
@@ -1316,7 +1656,11 @@ DmTask_set_cookie(DmTaskObject *self, PyObject *args)
     Py_INCREF(cookie);
     self->ck_cookie = cookie;
 
-    if (!dm_task_set_cookie(self->tk_dmt, &cookie->ck_cookie, flags)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_task_set_cookie(self->tk_dmt, &cookie->ck_cookie, flags);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetString(PyExc_OSError, "Failed to set DmTask cookie.");
         goto fail;
     }
@@ -1641,7 +1985,11 @@ DmTask_get_errno(DmTaskObject *self, PyObject *args)
 "Set the device-mapper UUID of this `DmTask`."
 
 #define DMTASK_run__doc__ \
-"Run the task associated with this `DmTask`."
+"Run the task associated with this `DmTask`.\n\n"                         \
+"The GIL is released while the ioctl is in progress, allowing other\n"     \
+"Python threads to run. Concurrent calls to `run()` are serialised, and\n" \
+"the `DmTask` must not be modified by another thread until `run()`\n"      \
+"returns."
 
 #define DMTASK_get_driver_version__doc__  \
 "Get the version of the device-mapper driver in use from this `DmTask`."
@@ -1658,6 +2006,12 @@ DmTask_get_errno(DmTaskObject *self, PyObject *args)
 #define DMTASK_get_deps__doc__ \
 "Get the list of dependencies for the dm device."
 
+#define DMTASK_get_targets__doc__ \
+"Get the targets returned by a prior `DM_DEVICE_TABLE` or\n"               \
+"`DM_DEVICE_STATUS` operation on this `DmTask`.\n\nReturns a list of "     \
+"4-tuples containing the start sector, length,\ntarget type, and the "    \
+"table parameters or status string of each\ntarget."
+
 #define DMTASK_get_versions__doc__ \
 "Get target version dictionary following a `DM_DEVICE_LIST_VERSIONS`\n"    \
 "command.\n\nReturns a dictionary whose keys are device-mapper target "    \
@@ -1674,6 +2028,14 @@ DmTask_get_errno(DmTaskObject *self, PyObject *args)
 "on this `DmTask`.\n\nReturns a list of 3-tuples containing the device "     \
 "name, major, and minor number."
 
+#define DMTASK_get_names_buffer__doc__ \
+"Get the device names returned by a prior DM_DEVICE_LIST operation on "     \
+"this\n`DmTask` in columnar form.\n\nReturns a 3-tuple of a `bytes` "       \
+"object containing the NUL-terminated\ndevice names, followed by two "      \
+"`array.array` objects of unsigned int\n(typecode 'I') giving the major "    \
+"and minor numbers of each device. This\navoids building a tuple per "     \
+"device when listing large numbers of devices."
+
 #define DMTASK_set_ro__doc__ \
 "Set the read-only flag in this `DmTask`."
 
@@ -1767,6 +2129,14 @@ DmTask_get_errno(DmTaskObject *self, PyObject *args)
 #define DMTASK_get_errno__doc__ \
 "The `errno` from the last device-mapper ioctl performed by `DmTask.run`."
 
+#define DMTASK_create_many__doc__ \
+"Create a new `DmTask` for each DM_DEVICE_* type in the iterable " \
+"`types`, and return them as a list in the same order. When called " \
+"on a subclass, the subclass is called for each type.\n\nEvery type " \
+"is checked before any task is created: if any type is invalid, or " \
+"a task cannot be created, an exception is raised and no tasks are " \
+"returned."
+
 #define DMTASK___doc__ \
 ""
 
@@ -1775,7 +2145,7 @@ static PyMethodDef DmTask_methods[] = {
         PyDoc_STR(DMTASK_set_name__doc__)},
     {"set_uuid", (PyCFunction)DmTask_set_uuid, METH_VARARGS,
         PyDoc_STR(DMTASK_set_uuid__doc__)},
-    {"run", (PyCFunction)DmTask_run, METH_VARARGS,
+    {"run", (PyCFunction)DmTask_run, METH_NOARGS,
         PyDoc_STR(DMTASK_run__doc__)},
     {"get_driver_version", (PyCFunction)DmTask_get_driver_version, METH_NOARGS,
         PyDoc_STR(DMTASK_get_driver_version__doc__)},
@@ -1785,6 +2155,8 @@ static PyMethodDef DmTask_methods[] = {
         PyDoc_STR(DMTASK_get_uuid__doc__)},
     {"get_deps", (PyCFunction)DmTask_get_deps, METH_NOARGS,
         PyDoc_STR(DMTASK_get_deps__doc__)},
+    {"get_targets", (PyCFunction)DmTask_get_targets, METH_NOARGS,
+        PyDoc_STR(DMTASK_get_targets__doc__)},
     {"get_versions", (PyCFunction)DmTask_get_versions, METH_NOARGS,
         PyDoc_STR(DMTASK_get_versions__doc__)},
     {"get_message_response", (PyCFunction)DmTask_get_message_response,
@@ -1793,9 +2165,11 @@ static PyMethodDef DmTask_methods[] = {
         PyDoc_STR(DMTASK_get_name__doc__)},
     {"get_names", (PyCFunction)DmTask_get_names, METH_NOARGS,
         PyDoc_STR(DMTASK_get_names__doc__)},
+    {"get_names_buffer", (PyCFunction)DmTask_get_names_buffer, METH_NOARGS,
+        PyDoc_STR(DMTASK_get_names_buffer__doc__)},
     {"set_ro", (PyCFunction)DmTask_set_ro, METH_NOARGS,
         PyDoc_STR(DMTASK_set_ro__doc__)},
-    {"set_newname", (PyCFunction)DmTask_set_newname, METH_VARARGS,
+    {"set_newname", (PyCFunction)DmTask_set_newname, METH_O,
         PyDoc_STR(DMTASK_set_newname__doc__)},
     {"set_newuuid", (PyCFunction)DmTask_set_newuuid, METH_VARARGS,
         PyDoc_STR(DMTASK_set_newuuid__doc__)},
@@ -1851,6 +2225,8 @@ static PyMethodDef DmTask_methods[] = {
         PyDoc_STR(DMTASK_add_target__doc__)},
     {"get_errno", (PyCFunction)DmTask_get_errno, METH_VARARGS,
         PyDoc_STR(DMTASK_get_errno__doc__)},
+    {"create_many", (PyCFunction)DmTask_create_many, METH_O | METH_CLASS,
+        PyDoc_STR(DMTASK_create_many__doc__)},
     {NULL, NULL}           /* sentinel */
 };
 
@@ -2423,6 +2799,7 @@ DmStats_list(DmStatsObject *self, PyObject *args, PyObject *kwds)
 {
     static char *kwlist[] = {"program_id", NULL};
     char *program_id = NULL;
+    int r;
 
     if (!PyArg_ParseTupleAndKeywords(args, kwds, "|z:list",
                                      kwlist, &program_id))
@@ -2430,7 +2807,11 @@ DmStats_list(DmStatsObject *self, PyObject *args, PyObject *kwds)
 
     _DmStats_clear_region_cache(self);
 
-    if (!dm_stats_list(self->ds_dms, program_id)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_stats_list(self->ds_dms, program_id);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetString(PyExc_OSError, "Failed to get region list from "
                         "device-mapper.");
         return NULL;
@@ -2448,13 +2829,19 @@ DmStats_populate(DmStatsObject *self, PyObject *args, PyObject *kwds)
     static char *kwlist[] = {"program_id", "region_id", NULL};
     uint64_t region_id = DM_STATS_REGIONS_ALL;
     char *program_id = NULL;
+    int r;
 
     if (!PyArg_ParseTupleAndKeywords(args, kwds, "|zl:list",
                                      kwlist, &program_id, &region_id))
         return NULL;
 
     _DmStats_clear_region_cache(self);
-    if (!dm_stats_populate(self->ds_dms, program_id, region_id)) {
+
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_stats_populate(self->ds_dms, program_id, region_id);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetString(PyExc_OSError, "Failed to get region data from "
                         "device-mapper.");
         return NULL;
@@ -2482,8 +2869,10 @@ DmStats_create_region(DmStatsObject *self, PyObject *args, PyObject *kwds)
         return NULL;
 
     errno = 0;
+    DMPY_BEGIN_LIBDM_CALL
     r = dm_stats_create_region(self->ds_dms, &region_id, start, len, step,
                                precise, bounds, program_id, user_data);
+    DMPY_END_LIBDM_CALL
 
     if (!r) {
         if (errno)
@@ -2499,6 +2888,8 @@ DmStats_create_region(DmStatsObject *self, PyObject *args, PyObject *kwds)
 
 static int _DmStats_delete_region(DmStatsObject *self, uint64_t region_id)
 {
+    int r;
+
     if (!dm_stats_region_present(self->ds_dms, region_id)) {
         PyErr_Format(PyExc_IndexError, "mStats region_id " FMTu64
                      " does not exist.", region_id);
@@ -2507,7 +2898,11 @@ static int _DmStats_delete_region(DmStatsObject *self, uint64_t region_id)
 
     errno = 0;
 
-    if (!dm_stats_delete_region(self->ds_dms, region_id)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_stats_delete_region(self->ds_dms, region_id);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         if (errno)
             PyErr_SetFromErrno(PyExc_OSError);
         else
@@ -3449,22 +3844,42 @@ static PyTypeObject DmStatsArea_Type = {
  * dmpy module methods.
  */
 
+/* Fill version with the library version string, or set an exception. */
+static int
+_dmpy_read_lib_version(char *version, size_t size)
+{
+    if (!dm_get_library_version(version, size)) {
+        PyErr_SetString(PyExc_OSError, "Failed to get device-mapper "
+                        "library version.");
+        return 0;
+    }
+    return 1;
+}
+
 static PyObject *
 _dmpy_get_lib_version(PyObject *self, PyObject *args)
 {
     char version[64];
-    if (!dm_get_library_version(version, sizeof(version))) {
-        PyErr_SetString(PyExc_OSError, "Failed to get device-mapper "
-                        "library version.");
+    if (!_dmpy_read_lib_version(version, sizeof(version)))
         return NULL;
-    } 
     return Py_BuildValue("s", version);
 }
 
+static PyObject *
+_dmpy_get_lib_version_bytes(PyObject *self, PyObject *args)
+{
+    char version[64];
+    if (!_dmpy_read_lib_version(version, sizeof(version)))
+        return NULL;
+    return PyBytes_FromString(version);
+}
+
 static PyObject *
 _dmpy_update_nodes(PyObject *self, PyObject *args)
 {
+    DMPY_BEGIN_LIBDM_CALL
     dm_task_update_nodes();
+    DMPY_END_LIBDM_CALL
     Py_INCREF(Py_True);
     return Py_True;
 }
@@ -3472,7 +3887,7 @@ _dmpy_update_nodes(PyObject *self, PyObject *args)
 static PyObject *
 _dmpy_set_name_mangling_mode(PyObject *self, PyObject *args)
 {
-    int mangle_mode;
+    int mangle_mode, r;
 
     if (!PyArg_ParseTuple(args, "i:set_name_mangling_mode", &mangle_mode))
         return NULL;
@@ -3483,7 +3898,11 @@ _dmpy_set_name_mangling_mode(PyObject *self, PyObject *args)
         return NULL;
     }
 
-    if (!dm_set_name_mangling_mode(mangle_mode)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_set_name_mangling_mode(mangle_mode);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetString(PyExc_OSError, "Failed to set device-mapper name "
                         "mangling mode.");
         return NULL;
@@ -3500,11 +3919,13 @@ _dmpy_get_name_mangling_mode(PyObject *self, PyObject *args)
 }
 
 static PyObject *
-_dmpy_set_dev_dir(PyObject *self, PyObject *args)
+_dmpy_set_dev_dir(PyObject *self, PyObject *arg)
 {
-    char *dir;
+    const char *dir;
+    Py_ssize_t len;
+    int r;
 
-    if (!PyArg_ParseTuple(args, "s:set_dev_dir", &dir))
+    if (!(dir = _dmpy_str_arg(arg, "set_dev_dir", &len)))
         goto fail;
 
     if (dir[0] != '/') {
@@ -3513,7 +3934,11 @@ _dmpy_set_dev_dir(PyObject *self, PyObject *args)
         goto fail;
     }
 
-    if (!dm_set_dev_dir(dir)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_set_dev_dir(dir);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_Format(PyExc_ValueError, "Invalid directory value, %s: "
                      "name too long.", dir);
         goto fail;
@@ -3526,18 +3951,37 @@ fail:
     return NULL;
 }
 
+/*
+ * Return a str copied from the libdm static buffer returned by `getter`,
+ * taking the copy under the run lock so that it cannot race a setter.
+ */
+static PyObject *
+_dmpy_get_lib_string(const char *(*getter)(void))
+{
+    char value[PATH_MAX];
+
+    DMPY_BEGIN_LIBDM_CALL
+    strncpy(value, getter(), sizeof(value) - 1);
+    value[sizeof(value) - 1] = '\0';
+    DMPY_END_LIBDM_CALL
+
+    return Py_BuildValue("s", value);
+}
+
 static PyObject *
 _dmpy_get_dev_dir(PyObject *self, PyObject *args)
 {
-    return Py_BuildValue("s", dm_dir());
+    return _dmpy_get_lib_string(dm_dir);
 }
 
 static PyObject *
-_dmpy_set_sysfs_dir(PyObject *self, PyObject *args)
+_dmpy_set_sysfs_dir(PyObject *self, PyObject *arg)
 {
-    char *dir;
+    const char *dir;
+    Py_ssize_t len;
+    int r;
 
-    if (!PyArg_ParseTuple(args, "s:set_sysfs_dir", &dir))
+    if (!(dir = _dmpy_str_arg(arg, "set_sysfs_dir", &len)))
         goto fail;
 
     if (dir[0] != '/') {
@@ -3546,7 +3990,11 @@ _dmpy_set_sysfs_dir(PyObject *self, PyObject *args)
         goto fail;
     }
 
-    if (!dm_set_sysfs_dir(dir)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_set_sysfs_dir(dir);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_Format(PyExc_ValueError, "Invalid directory value, %s: "
                      "name too long.", dir);
         goto fail;
@@ -3562,31 +4010,32 @@ fail:
 static PyObject *
 _dmpy_get_sysfs_dir(PyObject *self, PyObject *args)
 {
-    return Py_BuildValue("s", dm_sysfs_dir());
+    return _dmpy_get_lib_string(dm_sysfs_dir);
 }
 
 /* Taken from libdm/libdm-common.c */
 #define DM_MAX_UUID_PREFIX_LEN  15
 
 static PyObject *
-_dmpy_set_uuid_prefix(PyObject *self, PyObject *args)
+_dmpy_set_uuid_prefix(PyObject *self, PyObject *arg)
 {
-    char *prefix;
-
-    if (!PyArg_ParseTuple(args, "s:set_uuid_prefix", &prefix))
-        goto fail;
+    const char *prefix;
+    Py_ssize_t len;
+    int r;
 
-    if (!prefix) {
-        PyErr_SetString(PyExc_ValueError, "New uuid prefix cannot be empty.");
+    if (!(prefix = _dmpy_str_arg(arg, "set_uuid_prefix", &len)))
         goto fail;
-    }
 
-    if (strlen(prefix) > DM_MAX_UUID_PREFIX_LEN) {
+    if (len > DM_MAX_UUID_PREFIX_LEN) {
         PyErr_Format(PyExc_ValueError, "New uuid prefix %s too long.", prefix);
         goto fail;
     }
 
-    if (!dm_set_uuid_prefix(prefix)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_set_uuid_prefix(prefix);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetString(PyExc_OSError, "Failed to set new uuid prefix.");
         goto fail;
     }
@@ -3601,18 +4050,22 @@ fail:
 static PyObject *
 _dmpy_get_uuid_prefix(PyObject *self, PyObject *args)
 {
-    return Py_BuildValue("s", dm_uuid_prefix());
+    return _dmpy_get_lib_string(dm_uuid_prefix);
 }
 
 static PyObject *
 _dmpy_is_dm_major(PyObject *self, PyObject *args)
 {
-    int major;
+    int major, r;
 
     if (!PyArg_ParseTuple(args, "i:is_dm_major", &major))
         return NULL;
 
-    if (dm_is_dm_major(major)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_is_dm_major(major);
+    DMPY_END_LIBDM_CALL
+
+    if (r) {
         Py_INCREF(Py_True);
         return Py_True;
     } else {
@@ -3624,7 +4077,9 @@ _dmpy_is_dm_major(PyObject *self, PyObject *args)
 static PyObject *
 _dmpy_lib_release(PyObject *self, PyObject *args)
 {
+    DMPY_BEGIN_LIBDM_CALL
     dm_lib_release();
+    DMPY_END_LIBDM_CALL
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -3638,7 +4093,9 @@ _dmpy_hold_control_dev(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "i:hold_control_dev", &hold_open))
         return NULL;
 
+    DMPY_BEGIN_LIBDM_CALL
     dm_hold_control_dev(hold_open);
+    DMPY_END_LIBDM_CALL
 
     if (hold_open)
         ret = Py_True;
@@ -3653,11 +4110,16 @@ static PyObject *
 _dmpy_mknodes(PyObject *self, PyObject *args)
 {
     char *name = NULL;
+    int r;
 
     if (!PyArg_ParseTuple(args, "z:mknodes", &name))
         goto fail;
 
-    if (!dm_mknodes(name)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_mknodes(name);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetFromErrno(PyExc_OSError);
         goto fail;
     }
@@ -3673,8 +4135,13 @@ static PyObject *
 _dmpy_driver_version(PyObject *self, PyObject *args)
 {
     char version[DMPY_VERSION_BUF_LEN];
+    int r;
 
-    if (!dm_driver_version(version, sizeof(version))) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_driver_version(version, sizeof(version));
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
@@ -3685,7 +4152,10 @@ _dmpy_driver_version(PyObject *self, PyObject *args)
 static PyObject *
 _dmpy_dump_memory(PyObject *self, PyObject *args)
 {
+    DMPY_BEGIN_LIBDM_CALL
     dm_dump_memory();
+    DMPY_END_LIBDM_CALL
+
     Py_INCREF(Py_True);
     return Py_True;
 }
@@ -3698,7 +4168,9 @@ _dmpy_udev_set_sync_support(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "i:udev_set_sync_support", &sync_with_udev))
         return NULL;
 
+    DMPY_BEGIN_LIBDM_CALL
     dm_udev_set_sync_support(sync_with_udev);
+    DMPY_END_LIBDM_CALL
 
     Py_INCREF(Py_None);
     return Py_None;
@@ -3718,7 +4190,9 @@ _dmpy_udev_set_checking(PyObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "i:udev_set_checking", &checking))
         return NULL;
 
+    DMPY_BEGIN_LIBDM_CALL
     dm_udev_set_checking(checking);
+    DMPY_END_LIBDM_CALL
 
     Py_INCREF(Py_None);
     return Py_None;
@@ -3734,7 +4208,12 @@ static PyObject *
 _dmpy_cookie_supported(PyObject *self, PyObject *args)
 {
     PyObject *ret = Py_True;
-    int cookie_supported = dm_cookie_supported();
+    int cookie_supported;
+
+    DMPY_BEGIN_LIBDM_CALL
+    cookie_supported = dm_cookie_supported();
+    DMPY_END_LIBDM_CALL
+
     if (!cookie_supported)
         ret = Py_False;
     Py_INCREF(ret);
@@ -3746,8 +4225,13 @@ _dmpy_udev_create_cookie(PyObject *self, PyObject *args)
 {
     DmCookieObject *cookie;
     uint32_t cookie_val;
+    int r;
 
-    if (!dm_udev_create_cookie(&cookie_val)) {
+    DMPY_BEGIN_LIBDM_CALL
+    r = dm_udev_create_cookie(&cookie_val);
+    DMPY_END_LIBDM_CALL
+
+    if (!r) {
         PyErr_SetFromErrno(PyExc_OSError);
         return NULL;
     }
@@ -3792,8 +4276,12 @@ _dmpy_udev_wait(PyObject *self, PyObject *args, PyObject *kwds)
 static PyObject *
 _dmpy_message_supports_precise_timestamps(PyObject *self, PyObject *args)
 {
-    int precise = dm_message_supports_precise_timestamps();
     PyObject *ret;
+    int precise;
+
+    DMPY_BEGIN_LIBDM_CALL
+    precise = dm_message_supports_precise_timestamps();
+    DMPY_END_LIBDM_CALL
 
     if (precise)
         ret = Py_True;
@@ -3807,8 +4295,12 @@ _dmpy_message_supports_precise_timestamps(PyObject *self, PyObject *args)
 static PyObject *
 _dmpy_stats_driver_supports_precise(PyObject *self, PyObject *args)
 {
-    int precise = dm_stats_driver_supports_precise();
     PyObject *ret;
+    int precise;
+
+    DMPY_BEGIN_LIBDM_CALL
+    precise = dm_stats_driver_supports_precise();
+    DMPY_END_LIBDM_CALL
 
     if (precise)
         ret = Py_True;
@@ -3822,8 +4314,12 @@ _dmpy_stats_driver_supports_precise(PyObject *self, PyObject *args)
 static PyObject *
 _dmpy_stats_driver_supports_histogram(PyObject *self, PyObject *args)
 {
-    int histogram = dm_stats_driver_supports_histogram();
     PyObject *ret;
+    int histogram;
+
+    DMPY_BEGIN_LIBDM_CALL
+    histogram = dm_stats_driver_supports_histogram();
+    DMPY_END_LIBDM_CALL
 
     if (histogram)
         ret = Py_True;
@@ -3839,6 +4335,10 @@ _dmpy_stats_driver_supports_histogram(PyObject *self, PyObject *args)
 #define DMPY_get_library_version__doc__ "Get the version of the device-mapper" \
 " library in use. Returns a string, for e.g. \"1.02.122 (2016-04-09)\"."
 
+#define DMPY_get_library_version_bytes__doc__ "Get the version of the " \
+"device-mapper library in use as a bytes object, without decoding it, " \
+"for e.g. b\"1.02.122 (2016-04-09)\"."
+
 #define DMPY_update_nodes__doc__ \
 "Call this to make or remove the device nodes associated with previously " \
 "issued commands."
@@ -3946,21 +4446,23 @@ _dmpy_stats_driver_supports_histogram(PyObject *self, PyObject *args)
 static PyMethodDef dmpy_methods[] = {
     {"get_library_version", (PyCFunction)_dmpy_get_lib_version, METH_NOARGS,
         PyDoc_STR(DMPY_get_library_version__doc__)},
+    {"get_library_version_bytes", (PyCFunction)_dmpy_get_lib_version_bytes,
+        METH_NOARGS, PyDoc_STR(DMPY_get_library_version_bytes__doc__)},
     {"update_nodes", (PyCFunction)_dmpy_update_nodes, METH_NOARGS,
         PyDoc_STR(DMPY_update_nodes__doc__)},
     {"set_name_mangling_mode", (PyCFunction)_dmpy_set_name_mangling_mode,
         METH_VARARGS, PyDoc_STR(DMPY_set_name_mangling_mode__doc__)},
     {"get_name_mangling_mode", (PyCFunction)_dmpy_get_name_mangling_mode,
         METH_NOARGS, PyDoc_STR(DMPY_get_name_mangling_mode__doc__)},
-    {"set_dev_dir", (PyCFunction)_dmpy_set_dev_dir, METH_VARARGS,
+    {"set_dev_dir", (PyCFunction)_dmpy_set_dev_dir, METH_O,
         PyDoc_STR(DMPY_set_dev_dir__doc__)},
     {"get_dev_dir", (PyCFunction)_dmpy_get_dev_dir, METH_NOARGS,
         PyDoc_STR(DMPY_get_dev_dir__doc__)},
-    {"set_sysfs_dir", (PyCFunction)_dmpy_set_sysfs_dir, METH_VARARGS,
+    {"set_sysfs_dir", (PyCFunction)_dmpy_set_sysfs_dir, METH_O,
         PyDoc_STR(DMPY_set_sysfs_dir__doc__)},
     {"get_sysfs_dir", (PyCFunction)_dmpy_get_sysfs_dir, METH_NOARGS,
         PyDoc_STR(DMPY_get_sysfs_dir__doc__)},
-    {"set_uuid_prefix", (PyCFunction)_dmpy_set_uuid_prefix, METH_VARARGS,
+    {"set_uuid_prefix", (PyCFunction)_dmpy_set_uuid_prefix, METH_O,
         PyDoc_STR(DMPY_set_uuid_prefix__doc__)},
     {"get_uuid_prefix", (PyCFunction)_dmpy_get_uuid_prefix, METH_NOARGS,
         PyDoc_STR(DMPY_get_uuid_prefix__doc__)},
@@ -4200,6 +4702,11 @@ dmpy_exec(PyObject *m)
     /* initialise dm globals */
     dm_lib_init();
 
+    if (!_dmpy_run_lock && !(_dmpy_run_lock = PyThread_allocate_lock())) {
+        PyErr_NoMemory();
+        goto fail;
+    }
+
     /* Register AtExit call to dm_lib_exit() */
     if (Py_AtExit(dm_lib_exit) < 0)
         goto fail;
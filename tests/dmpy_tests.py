@@ -14,53 +14,149 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA
 
+import sys
 import unittest
-import shlex
-from os import readlink, unlink, stat, major, minor
-from os.path import exists, join
+from contextlib import contextmanager
+from os import listdir, readlink, unlink, stat, major, minor, urandom
+from os import ftruncate, getpid, geteuid, access, O_RDONLY, R_OK, W_OK
+from os import open as os_open, read as os_read, close as os_close
+from os.path import basename, dirname, exists, join, realpath
+from binascii import hexlify
 from subprocess import Popen, PIPE, STDOUT
-from random import random
-from time import sleep
+from threading import Thread
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # Python 2: test_import relies on the sys.modules check alone.
+    find_spec = None
+try:
+    from shutil import which
+except ImportError:
+    # Python 2: leave command names to be resolved by exec.
+    def which(cmd):
+        return None
+
+try:
+    import dmpy as dm
+    # Without a built module, running from the top-level directory
+    # imports the dmpy/ source directory as an empty namespace package.
+    dm.DmTask
+
+    # All defined DM_DEVICE_* task types.
+    _ALL_TASK_TYPES = (
+        dm.DM_DEVICE_CREATE, dm.DM_DEVICE_RELOAD, dm.DM_DEVICE_REMOVE,
+        dm.DM_DEVICE_REMOVE_ALL, dm.DM_DEVICE_SUSPEND, dm.DM_DEVICE_RESUME,
+        dm.DM_DEVICE_INFO, dm.DM_DEVICE_DEPS, dm.DM_DEVICE_RENAME,
+        dm.DM_DEVICE_VERSION, dm.DM_DEVICE_STATUS, dm.DM_DEVICE_TABLE,
+        dm.DM_DEVICE_WAITEVENT, dm.DM_DEVICE_LIST, dm.DM_DEVICE_CLEAR,
+        dm.DM_DEVICE_MKNODES, dm.DM_DEVICE_LIST_VERSIONS,
+        dm.DM_DEVICE_TARGET_MSG, dm.DM_DEVICE_SET_GEOMETRY,
+    )
+    _dm_import_error = None
+except (ImportError, AttributeError) as e:
+    # Skip the tests that need the module, and fail test_import with the
+    # reason, rather than failing to load this file.
+    dm = None
+    _ALL_TASK_TYPES = ()
+    _dm_import_error = e
 
 # Non-exported device-mapper constants: used for tests only.
 DM_NAME_LEN = 128  # includes NULL
 DM_MAX_UUID_PREFIX_LEN = 15
 
+# Longest valid name, shortest too-long name, and a too-long uuid prefix.
+_NAME_OK = "A" * (DM_NAME_LEN - 1)
+_NAME_TOO_LONG = "A" * DM_NAME_LEN
+_UUID_PREFIX_TOO_LONG = "X" * (DM_MAX_UUID_PREFIX_LEN + 1)
+
 # Format for dmpytestN test devices.
 _uuid_prefix = "DMPY-"
-_uuid_format = "%s%x"
 
 _dev_mapper = "/dev/mapper"
+_dm_control = join(_dev_mapper, "control")
+_proc_self_fd = "/proc/self/fd"
+
+# Tests that issue ioctls need root and access to the control device:
+# check once, rather than failing each test with EPERM.
+_HAS_DM = geteuid() == 0 and access(_dm_control, R_OK | W_OK)
+_requires_dm = unittest.skipUnless(_HAS_DM,
+                                   "requires device-mapper control access")
 
-_udev_wait_delay = 0.1
+
+def _unique_name(name):
+    """ Qualify a test device or image file name with the process ID so
+        that concurrent test runs do not collide.
+    """
+    return "%s-%d" % (name, getpid())
 
 
 def _new_uuid():
-    rand = random() * 2 ** 64
-    return _uuid_format % (_uuid_prefix, int(rand))
+    # 64 random bits as 16 hex digits.
+    return _uuid_prefix + hexlify(urandom(8)).decode('ascii')
 
 
-def _get_cmd_output(cmd):
-    """ Call `cmd` via `Popen` and return the status and combined `stdout`
-        and `stderr` as a 2-tuple, e.g.:
+def _memoize(fn):
+    """ Cache the result of the no-argument function `fn` so that it is
+        only computed once per test run.
+    """
+    cache = []
+
+    def wrapper():
+        if not cache:
+            cache.append(fn())
+        return cache[0]
+    return wrapper
 
-        (0, "vg00/lvol0: Created new region with 1 area(s) as region ID 5\n")
 
+_cmd_paths = {}
+
+
+def _cmd_path(cmd):
+    """ Return the full path to `cmd`, looked up once in `PATH`.
     """
-    args = shlex.split(cmd)
+    if cmd not in _cmd_paths:
+        _cmd_paths[cmd] = which(cmd) or cmd
+    return _cmd_paths[cmd]
+
+
+def _get_cmd_output(argv):
+    """ Call the command given by the argument list `argv` via `Popen`
+        and return the status and combined `stdout` and `stderr` as a
+        2-tuple, e.g.:
+
+        (0, "vg00/lvol0: Created new region with 1 area(s) as region ID 5\n")
 
-    p = Popen(args, shell=False, stdout=PIPE,
-              stderr=STDOUT, bufsize=-1, close_fds=True)
+        The test suite does not hold any descriptors that the child must
+        not inherit, so `close_fds` is disabled to avoid walking the fd
+        table on every call. Together with a fully qualified executable
+        path this lets `Popen` use `posix_spawn()` instead of fork+exec.
+    """
+    argv = [_cmd_path(argv[0])] + argv[1:]
+    p = Popen(argv, shell=False, stdout=PIPE,
+              stderr=STDOUT, bufsize=-1, close_fds=False)
 
-    # stderr will always be None
-    (stdout, stderr) = p.communicate()
+    # stderr is merged into stdout: read it to EOF, then reap the child.
+    stdout = p.stdout.read()
+    p.stdout.close()
+    p.wait()
 
     # Change the codec if testing in a non-utf8 environment.
     return (p.returncode, stdout.decode('utf-8'))
 
 
-def _read_ahead_from_blockdev(dev_path):
-    return int(_get_cmd_output("blockdev --getra %s" % dev_path)[1])
+def _control_fd_open():
+    """ Return `True` if this process has a file descriptor open on the
+        device-mapper control device. The descriptor number depends on
+        what the test runner already has open, so check all of them.
+    """
+    for fd in listdir(_proc_self_fd):
+        try:
+            if readlink(join(_proc_self_fd, fd)) == _dm_control:
+                return True
+        except OSError:
+            # The descriptor used by listdir() is already closed.
+            continue
+    return False
 
 
 def _get_major_minor_from_stat(dev_path):
@@ -68,134 +164,221 @@ def _get_major_minor_from_stat(dev_path):
     return (major(st_buf.st_rdev), minor(st_buf.st_rdev))
 
 
+def _read_small(path, size=64):
+    """ Read up to `size` bytes from `path` with a single `read()` on an
+        unbuffered descriptor, for short sysfs and procfs attributes.
+    """
+    fd = os_open(path, O_RDONLY)
+    try:
+        return os_read(fd, size)
+    finally:
+        os_close(fd)
+
+
+def _read_ahead_from_sysfs(dev_path):
+    """ Return the read-ahead of `dev_path` in sectors, as reported by
+        `blockdev --getra`, from the device's sysfs queue attributes.
+    """
+    dev_name = basename(realpath(dev_path))
+    read_ahead_path = "/sys/class/block/%s/queue/read_ahead_kb" % dev_name
+    return int(_read_small(read_ahead_path)) * 2
+
+
 def _get_dm_major_from_dm_0_sysfs():
     dm0_sysfs_path = "/sys/block/dm-0/dev"
-    major = None
-    minor = None
-    with open(dm0_sysfs_path, "r") as f:
-        (major, minor) = f.read().strip().split(":")
+    (major, sep, minor) = _read_small(dm0_sysfs_path).partition(b":")
     return int(major)
 
 
 def _get_dm_major_from_proc():
     proc_devices_path = "/proc/devices"
-    with open(proc_devices_path) as f:
-        block_seen = False
-        for line in f.readlines():
-            if "Block" in line:
-                block_seen = True
-                continue
-            if block_seen and "device-mapper" in line:
-                (major, name) = line.split(" ")
-                break
-    return int(major)
+    # Read the whole file with one read() to avoid torn procfs reads.
+    buf = _read_small(proc_devices_path, 65536)
+    # Lines are "%3d %s\n": find the device-mapper entry in the block
+    # device section and parse the major that precedes it.
+    blk = buf.find(b"\nBlock devices:\n")
+    if blk < 0:
+        raise LookupError("No block devices in %s" % proc_devices_path)
+    end = buf.find(b" device-mapper\n", blk)
+    if end < 0:
+        raise LookupError("No device-mapper in %s" % proc_devices_path)
+    return int(buf[buf.rfind(b"\n", 0, end) + 1:end])
 
 
 # Try to find the (a) current device-mapper major number from sysfs,
 # or /proc/devices. This is used to test dmpy.is_dm_major().
+@_memoize
 def _get_dm_major():
     try:
         return _get_dm_major_from_dm_0_sysfs()
-    except:
+    except (OSError, ValueError):
         try:
             return _get_dm_major_from_proc()
-        except:
+        except (OSError, LookupError, ValueError):
             return 253
 
 
-def _get_table_from_dmsetup(dm_name):
-    return _get_cmd_output("dmsetup table %s" % dm_name)[1].strip()
+def _get_table(dm_name):
+    """ Return the table of `dm_name` from a `DM_DEVICE_TABLE` ioctl,
+        formatted in the same way as `dmsetup table`.
+    """
+    dmt = dm.DmTask(dm.DM_DEVICE_TABLE)
+    dmt.set_name(dm_name)
+    dmt.run()
+    return "\n".join("%d %d %s %s" % target for target in dmt.get_targets())
+
 
+def _get_size_sectors(dm_name):
+    """ Return the size of `dm_name` in sectors from its table.
+    """
+    dmt = dm.DmTask(dm.DM_DEVICE_TABLE)
+    dmt.set_name(dm_name)
+    dmt.run()
+    return sum(target[1] for target in dmt.get_targets())
 
-def _get_driver_version_from_dmsetup():
-    for line in _get_cmd_output("dmsetup version")[1].splitlines():
-        if not line.startswith("Driver version"):
-            continue
-        return line.split(":")[1].lstrip()
+
+@_memoize
+def _get_driver_version():
+    """ Return the driver version from a separate `DM_DEVICE_VERSION`
+        task, for comparison with other ways of obtaining it.
+    """
+    dmt = dm.DmTask(dm.DM_DEVICE_VERSION)
+    dmt.run()
+    return dmt.get_driver_version()
+
+
+def _stats_message(name, message):
+    """ Send the `@stats_*` message `message` to the device `name` and
+        return the response string.
+    """
+    dmt = dm.DmTask(dm.DM_DEVICE_TARGET_MSG)
+    dmt.set_name(name)
+    dmt.set_sector(0)
+    dmt.set_message(message)
+    dmt.run()
+    return dmt.get_message_response()
 
 
 def _create_stats(name, program_id="dmstats", nr_areas=1, precise=False,
                   start=None, length=None, aux_data=None):
-    args = "--programid %s" % program_id
-    if nr_areas > 1:
-        args += " --areas %d" % nr_areas
+    if start is None and length is None:
+        stats_range = "-"
+    else:
+        start = start or 0
+        if length is None:
+            # Cover the remainder of the device following `start`.
+            length = _get_size_sectors(name) - start
+        stats_range = "%d+%d" % (start, length)
+    args = [stats_range, "/%d" % nr_areas]
     if precise:
-        args += " --precise"
-    if start:
-        args += " --start %d" % start
-    if length:
-        args += " --length %d" % length
+        args += ["1", "precise_timestamps"]
+    args.append(program_id)
     if aux_data:
-        args += " --userdata %s" % aux_data
-
-    r = _get_cmd_output("dmstats create %s %s" % (args, name))
-    if r[0]:
+        args.append(aux_data)
+    try:
+        _stats_message(name, "@stats_create " + " ".join(args))
+    except OSError:
         raise OSError("Failed to create stats region")
 
+
 def _remove_all_stats(name):
-    # We use --allprograms --allregions here to work around dmstats versions
-    # that are missing commit 5eda393:
-	#
-	#  commit 5eda3934885b23ce06f862a56b524ceaab3cb565
-	#  Author: Bryn M. Reeves <bmr@redhat.com>
-	#  Date:   Mon Oct 24 17:21:18 2016 +0100
-	#
-	#     dmsetup: obey --programid when deleting regions
-	#
-    # Without this fix attempting to delete our own regions with --programid
-	# fails to remove all regions, causing assertion failures when dmpy tests
-	# attempt to validate the expected number of regions.
-    r = _get_cmd_output("dmstats delete --allprograms --allregions %s" % name)
-    if r[0]:
+    # An @stats_list with no program_id lists the regions of all programs:
+    # each line begins with "<region_id>: ".
+    try:
+        regions = _stats_message(name, "@stats_list")
+        for line in regions.splitlines():
+            region_id = line.partition(":")[0]
+            _stats_message(name, "@stats_delete " + region_id)
+    except OSError:
         raise OSError("Failed to remove stats regions.")
 
+
 def _create_loopback(path, size):
-    loop_file = join(path, "dmpy-test-img0")
-    r = _get_cmd_output("dd if=/dev/zero of=%s bs=%d count=1" %
-                        (loop_file, size))
+    loop_file = join(path, _unique_name("dmpy-test-img0"))
+    # A sparse file is sufficient: just set the length.
+    with open(loop_file, "wb") as f:
+        ftruncate(f.fileno(), size)
+    # Find a free loop device and attach it in a single losetup call.
+    r = _get_cmd_output(["losetup", "--find", "--show", loop_file])
     if r[0]:
-        raise OSError("Failed to create image file.")
-    r = _get_cmd_output("losetup -f")
-    if r[0]:
-        raise OSError("Failed to find free loop device.")
-    device = r[1].strip()
-    r = _get_cmd_output("losetup %s %s" % (device, loop_file))
-    return (device, loop_file)
+        unlink(loop_file)
+        raise OSError("Failed to set up loop device.")
+    return (r[1].strip(), loop_file)
 
 
 def _remove_loopback(loop_device):
     device, loop_file = loop_device
-    r = _get_cmd_output("losetup -d %s" % device)
+    r = _get_cmd_output(["losetup", "-d", device])
     if r[0]:
         raise OSError("Failed to remove loop device.")
     unlink(loop_file)
 
 
+def _run_task_udev(dmt, err_msg):
+    """ Run `dmt` with a udev cookie set and wait for udev to finish
+        processing the resulting events. The cookie is waited on even
+        if the ioctl fails, so that its resources are always released.
+    """
+    cookie = dm.DmCookie()
+    dmt.set_cookie(cookie)
+    try:
+        dmt.run()
+    except OSError:
+        raise OSError(err_msg)
+    finally:
+        cookie.udev_wait()
+
+
 def _create_linear_device(dev, size, uuid=_new_uuid):
-    dm_name = "dmpytest0"
+    dm_name = _unique_name("dmpytest0")
     sectors = size >> 9
 
     # if UUID is callable, call it.
     if hasattr(uuid, "__call__"):
         uuid = uuid()
 
-    uuid_arg = ("--uuid %s" % uuid) if uuid else ""
-    r = _get_cmd_output("dmsetup create %s %s "
-                        "--table='0 %d ""linear %s 0'" %
-                        (dm_name, uuid_arg, sectors, dev))
-    if r[0]:
-        raise OSError("Failed to create linear device.")
+    dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
+    dmt.set_name(dm_name)
+    if uuid:
+        dmt.set_uuid(uuid)
+    dmt.add_target(0, sectors, "linear", "%s 0" % dev)
+    _run_task_udev(dmt, "Failed to create linear device.")
 
     return dm_name
 
 
 def _remove_dm_device(dm_dev):
-    r = _get_cmd_output("dmsetup remove %s" % dm_dev)
-    if r[0]:
-        raise OSError("Failed to remove dm device %s." % dm_dev)
+    dmt = dm.DmTask(dm.DM_DEVICE_REMOVE)
+    dmt.set_name(dm_dev)
+    _run_task_udev(dmt, "Failed to remove dm device %s." % dm_dev)
+
 
+class DmpyImportTests(unittest.TestCase):
+    """ Tests of the module import: these must fail, not skip, when the
+        extension cannot be imported.
+    """
 
-class DmpyTests(unittest.TestCase):
+    def test_import(self):
+        # dmpy is imported at module scope: check that the import system
+        # can locate it without initialising the module a second time, and
+        # that the import provided the extension's types and exception.
+        # This test is not skipped when the import fails: it reports why.
+        if _dm_import_error is not None:
+            raise _dm_import_error
+        if find_spec:
+            self.assertIsNotNone(find_spec("dmpy"))
+        self.assertIs(sys.modules.get("dmpy"), dm)
+        for name in ("DmTask", "DmCookie", "DmStats", "DmTimestamp"):
+            self.assertTrue(isinstance(getattr(dm, name), type), name)
+        self.assertTrue(issubclass(dm.DmError, Exception))
+        self.assertEqual(dm.DmError.__module__, "dmpy")
+        self.assertTrue(callable(dm.get_library_version))
+
+
+@unittest.skipIf(dm is None, "dmpy is not importable")
+class _DmpyTestCase(unittest.TestCase):
+    """ Common constants and helpers for the dmpy test classes.
+    """
 
     test_dev_size_bytes = 2**20
     test_dev_size_sectors = 2**11
@@ -204,75 +387,78 @@ class DmpyTests(unittest.TestCase):
     dmpytest0 = None
     program_id = "dmpytest"
 
-    def udev_settle(self):
-        _get_cmd_output("udevadm settle")
+    if not hasattr(unittest.TestCase, "subTest"):
+        # Python 2: run sub-tests inline, stopping at the first failure.
+        @contextmanager
+        def subTest(self, msg=None, **params):
+            yield
 
-    def loop_minor(self, loop_name):
-        return int(loop_name.split("loop")[1])
-
-    def setUp(self):
-        uuid = _new_uuid()
-        dev_size = self.test_dev_size_bytes
-        self.loop0 = _create_loopback("/var/tmp/", dev_size)
-        self.dmpytest0_uuid = uuid
-        self.dmpytest0 = _create_linear_device(self.loop0[0],
-                                               dev_size, uuid=uuid)
-
-    def tearDown(self):
-        self.udev_settle()
-        if (self.dmpytest0):
-            _remove_dm_device(self.dmpytest0)
-        if (self.loop0):
-            _remove_loopback(self.loop0)
 
-    def test_import(self):
-        # attempt to import dmpy
-        try:
-            import dmpy as dm
-        except Exception as e:
-            self.fail(str(e))
+class DmpyLibraryTests(_DmpyTestCase):
+    """ Tests of process-wide libdevmapper settings. They need no test
+        devices, and the settings are restored after each test.
+    """
 
-    #
-    # Dmpy module tests.
-    #
+    def setUp(self):
+        self.addCleanup(dm.set_name_mangling_mode,
+                        dm.get_name_mangling_mode())
+        self.addCleanup(dm.set_uuid_prefix, dm.get_uuid_prefix())
+        # get_dev_dir() returns the "mapper" subdirectory of the dev_dir.
+        self.addCleanup(dm.set_dev_dir, dirname(dm.get_dev_dir()))
+        self.addCleanup(dm.set_sysfs_dir, dm.get_sysfs_dir())
+        self.addCleanup(dm.udev_set_sync_support, dm.udev_get_sync_support())
+        self.addCleanup(dm.udev_set_checking, dm.udev_get_checking())
 
     def test_dmpy_get_library_version(self):
-        import dmpy as dm
         # Assert the expected major/minor version values (good since Nov 2005).
         libdm_major_minor = "1.02"
         self.assertTrue(dm.get_library_version().startswith(libdm_major_minor))
 
-    def test_is_dm_major(self):
-        import dmpy as dm
-        # Assert that invalid dm major numbers return False.
-        self.assertFalse(dm.is_dm_major(0))
-        self.assertFalse(dm.is_dm_major(1))
-        self.assertFalse(dm.is_dm_major(-1))
-        # Assert that valid dm major numbers return True.
-        self.assertTrue(dm.is_dm_major(_get_dm_major()))
+    def test_dmpy_get_library_version_bytes(self):
+        # Assert that the undecoded version matches get_library_version().
+        version = dm.get_library_version_bytes()
+        self.assertTrue(isinstance(version, bytes))
+        self.assertTrue(version.startswith(b"1.02"))
+        self.assertEqual(version.decode("ascii"), dm.get_library_version())
 
-    def test_update_nodes(self):
-        pass  # FIXME: test with fake /dev and udev disabled.
+    @_requires_dm
+    def test_driver_version(self):
+        # Assert that the driver version string returned by
+        # `dmpy.driver_version()` matches the one returned by a
+        # DM_DEVICE_VERSION task.
+        dmpy_drv_version = dm.driver_version()
+        task_drv_version = _get_driver_version()
+        self.assertEqual(dmpy_drv_version, task_drv_version)
+
+    @_requires_dm
+    def test_task_get_driver_version(self):
+        # Assert that we can obtain the driver version from a task other
+        # than DM_DEVICE_VERSION, and that the result matches that obtained
+        # from DM_DEVICE_VERSION.
+        dmt = dm.DmTask(dm.DM_DEVICE_LIST)
+        dmt.run()
+        _version_driver_version = _get_driver_version()
+        _driver_version = dmt.get_driver_version()
+        self.assertTrue(_driver_version)
+        self.assertEqual(_version_driver_version, _driver_version)
 
     def test_set_get_name_mangling_mode(self):
         # Ensure that we get the same name_mangling_mode back as we set, and
         # that the default mode is as expected.
-        import dmpy as dm
         # Assert that dm.STRING_MANGLING_AUTO is default.
         initial_mode = dm.get_name_mangling_mode()
         self.assertEqual(initial_mode, dm.STRING_MANGLING_AUTO)
         # Assert that we get each mangling mode back as expected.
-        self.assertTrue(dm.set_name_mangling_mode(dm.STRING_MANGLING_NONE))
-        self.assertEqual(dm.get_name_mangling_mode(), dm.STRING_MANGLING_NONE)
-        self.assertTrue(dm.set_name_mangling_mode(dm.STRING_MANGLING_AUTO))
-        self.assertEqual(dm.get_name_mangling_mode(), dm.STRING_MANGLING_AUTO)
-        self.assertTrue(dm.set_name_mangling_mode(dm.STRING_MANGLING_HEX))
-        self.assertEqual(dm.get_name_mangling_mode(), dm.STRING_MANGLING_HEX)
+        modes = (dm.STRING_MANGLING_NONE, dm.STRING_MANGLING_AUTO,
+                 dm.STRING_MANGLING_HEX)
+        for mode in modes:
+            with self.subTest(mode=mode):
+                self.assertTrue(dm.set_name_mangling_mode(mode))
+                self.assertEqual(dm.get_name_mangling_mode(), mode)
 
     def test_set_get_dev_dir(self):
         # Ensure that we get the same dev_dir back as we set, and
         # that the default directory is as expected.
-        import dmpy as dm
         # Default device directory. If your libdevmapper was compiled with
         # a different value, change the definition of `default_dev_dir_get`.
         default_dev_dir_get = "/dev/mapper"
@@ -291,7 +477,6 @@ class DmpyTests(unittest.TestCase):
     def test_set_get_sysfs_dir(self):
         # Ensure that we get the same dev_dir back as we set, and
         # that the default directory is as expected.
-        import dmpy as dm
         # Default device directory. If your libdevmapper was compiled with
         # a different value, change the definition of `default_dev_dir_get`.
         default_sysfs_dir_get = "/sys/"
@@ -303,91 +488,127 @@ class DmpyTests(unittest.TestCase):
     def test_set_sysfs_dir_non_abs_path(self):
         # Assert that attampting to set a non-absolute sysfs path raises a
         # TypeError exception.
-        import dmpy as dm
         with self.assertRaises(ValueError) as cm:
             dm.set_sysfs_dir("./tests/sys")
 
     def test_set_uuid_prefix_too_long(self):
         # Assert that dmpy.set_uuid_prefix() with a prefix length
         # > DM_MAX_UUID_PREFIX_LEN raises ValueError.
-        import dmpy as dm
         with self.assertRaises(ValueError) as cm:
-            dm.set_uuid_prefix("X" * (DM_MAX_UUID_PREFIX_LEN + 1))
+            dm.set_uuid_prefix(_UUID_PREFIX_TOO_LONG)
 
     def test_set_get_uuid_prefix(self):
         # Assert that the expected prefix is returned following a set,
         # and that the default is `LVM-`.
         # FIXME: verify that the prefix is used in commands.
-        import dmpy as dm
         default_uuid_prefix = "LVM-"
         new_uuid_prefix = "QUX-"
         self.assertEqual(dm.get_uuid_prefix(), default_uuid_prefix)
         self.assertTrue(dm.set_uuid_prefix(new_uuid_prefix))
         self.assertEqual(dm.get_uuid_prefix(), new_uuid_prefix)
 
+    @_requires_dm
+    def test_dm_task_create_many(self):
+        # Assert that DmTask.create_many() returns one new DmTask for each
+        # requested type, and that an invalid type in the sequence raises.
+        tasks = dm.DmTask.create_many(_ALL_TASK_TYPES)
+        self.assertEqual(len(tasks), len(_ALL_TASK_TYPES))
+        self.assertTrue(all(isinstance(dmt, dm.DmTask) for dmt in tasks))
+        with self.assertRaises(TypeError):
+            dm.DmTask.create_many((dm.DM_DEVICE_INFO, 2323))
+
+    @_requires_dm
+    def test_dm_task_create_many_subclass(self):
+        # Assert that create_many() on a subclass runs its __init__() for
+        # each type, and that an invalid type anywhere in the sequence
+        # raises before any task is created.
+        created = []
+
+        class DmTaskSub(dm.DmTask):
+            def __init__(self, ttype):
+                super(DmTaskSub, self).__init__(ttype)
+                created.append(ttype)
+
+        types = (dm.DM_DEVICE_INFO, dm.DM_DEVICE_LIST)
+        tasks = DmTaskSub.create_many(types)
+        self.assertTrue(all(type(dmt) is DmTaskSub for dmt in tasks))
+        self.assertEqual(tuple(created), types)
+
+        del created[:]
+        for bad_types in (types + (2323,), types + ("qux",)):
+            with self.assertRaises(TypeError):
+                DmTaskSub.create_many(bad_types)
+        self.assertEqual(created, [])
+
+    @_requires_dm
+    def test_dm_task_subclass_new(self):
+        # Assert that a DmTask subclass can be instantiated and released:
+        # its instances are allocated differently, and must be freed with
+        # the subclass's own deallocator.
+        class DmTaskSub(dm.DmTask):
+            pass
+
+        for ttype in (dm.DM_DEVICE_VERSION, dm.DM_DEVICE_LIST):
+            dmt = DmTaskSub(ttype)
+            self.assertTrue(isinstance(dmt, dm.DmTask))
+            del dmt
+        dmt = dm.DmTask(dm.DM_DEVICE_VERSION)
+        self.assertEqual(type(dmt), dm.DmTask)
+
+    @_requires_dm
+    def test_get_names_buffer_empty(self):
+        # Assert that an empty device list gives an empty name buffer and
+        # empty major and minor columns. This class creates no devices,
+        # but other users of device-mapper may have.
+        dmt = dm.DmTask(dm.DM_DEVICE_LIST)
+        dmt.run()
+        (name_buf, majors, minors) = dmt.get_names_buffer()
+        if name_buf:
+            self.skipTest("device-mapper devices are present")
+        self.assertEqual(majors.typecode, "I")
+        self.assertEqual(minors.typecode, "I")
+        self.assertEqual(len(majors), 0)
+        self.assertEqual(len(minors), 0)
+
+    @_requires_dm
     def test_lib_release_releases_fd(self):
         # Assert that a call to dmpy.lib_release() closes the ioctl file
         # descriptor.
-        import dmpy as dm
-        dev_mapper_control = join(_dev_mapper, "control")
-        control_fd_path = "/proc/self/fd/3"
-
         # Run a DM_DEVICE_LIST to open the ioctl fd.
         dmt = dm.DmTask(dm.DM_DEVICE_LIST)
         dmt.run()
         dmt = None
-        # Control fd path should exist now.
-        self.assertTrue(exists(control_fd_path))
-        self.assertEqual(dev_mapper_control, readlink(control_fd_path))
-        # Control fd path should be close following lib_release().
+        # Control fd should be open now.
+        self.assertTrue(_control_fd_open())
+        # Control fd should be closed following lib_release().
         dm.lib_release()
-        self.assertFalse(exists(control_fd_path))
+        self.assertFalse(_control_fd_open())
 
+    @_requires_dm
     def test_hold_control_dev_open(self):
         # Assert that dmpy.hold_control_dev_open() returns True, that the
         # control device is held open across a subsequent call to
         # dm.lib_release(), and that it is closed after hold_control_dev is
         # disabled and a second call to dm_lib_release() made.
-        import dmpy as dm
-        dev_mapper_control = join(_dev_mapper, "control")
-        control_fd_path = "/proc/self/fd/3"
-
         # Enable holding the control fd.
         dm.hold_control_dev(1)
         # Run a DM_DEVICE_LIST to open the ioctl fd.
         dmt = dm.DmTask(dm.DM_DEVICE_LIST)
         dmt.run()
         dmt = None
-        # Control fd path should exist now.
-        self.assertTrue(exists(control_fd_path))
-        self.assertEqual(dev_mapper_control, readlink(control_fd_path))
+        # Control fd should be open now.
+        self.assertTrue(_control_fd_open())
         dm.lib_release()
-        # Control fd path should exist now.
-        self.assertTrue(exists(control_fd_path))
+        # Control fd should still be open.
+        self.assertTrue(_control_fd_open())
         dm.hold_control_dev(0)
         dm.lib_release()
-        # Control fd path should not exist now.
-        self.assertFalse(exists(control_fd_path))
-
-    def test_mknodes(self):
-        pass  # FIXME: test with fake /dev and udev disabled.
-
-    def test_driver_version(self):
-        # Assert that the driver version string returned by
-        # `dmpy.driver_version()` matches the one returned by dmsetup.
-        import dmpy as dm
-        dmpy_drv_version = dm.driver_version()
-        dmsetup_drv_version = _get_driver_version_from_dmsetup()
-        self.assertEqual(dmpy_drv_version, dmsetup_drv_version)
-
-    def test_dump_memory(self):
-        # FIXME: test with custom logging fn?
-        pass
+        # Control fd should be closed now.
+        self.assertFalse(_control_fd_open())
 
     def test_set_get_udev_sync(self):
         # Assert that we get the expected result back after setting the
         # udev synchronization mode.
-        import dmpy as dm
 
         # Change this if your libdevmapper was built with differnt defaults.
         initial_udev_sync = 1
@@ -402,7 +623,6 @@ class DmpyTests(unittest.TestCase):
     def test_set_get_udev_checks(self):
         # Assert that we get the expected result back after setting the
         # udev synchronization mode.
-        import dmpy as dm
 
         # Change this if your libdevmapper was built with differnt defaults.
         initial_udev_check = 1
@@ -414,10 +634,87 @@ class DmpyTests(unittest.TestCase):
         dm.udev_set_checking(1)
         self.assertEqual(dm.udev_get_checking(), 1)
 
+
+@_requires_dm
+class _DmpyLoopTestCase(_DmpyTestCase):
+    """ Base class for tests that use test devices. The backing loop
+        device is never modified by the tests, so it is created once
+        per class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop0 = _create_loopback("/var/tmp/", cls.test_dev_size_bytes)
+        cls.loop0_dev = _get_major_minor_from_stat(cls.loop0[0])
+        # The table of a linear device mapping the whole loop device.
+        cls.expected_linear_table = "0 %d linear %d:%d 0" % (
+            (cls.test_dev_size_sectors,) + cls.loop0_dev)
+
+    @classmethod
+    def tearDownClass(cls):
+        if (cls.loop0):
+            _get_cmd_output(["udevadm", "settle"])
+            _remove_loopback(cls.loop0)
+            cls.loop0 = None
+
+
+class _DmpySharedDeviceTestCase(_DmpyLoopTestCase):
+    """ Base class for tests that do not modify the dmpytest0 device: a
+        single instance is shared by every test in the class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(_DmpySharedDeviceTestCase, cls).setUpClass()
+        cls.dmpytest0_uuid = _new_uuid()
+        cls.dmpytest0 = _create_linear_device(cls.loop0[0],
+                                              cls.test_dev_size_bytes,
+                                              uuid=cls.dmpytest0_uuid)
+
+    @classmethod
+    def tearDownClass(cls):
+        if (cls.dmpytest0):
+            _remove_dm_device(cls.dmpytest0)
+            cls.dmpytest0 = None
+        super(_DmpySharedDeviceTestCase, cls).tearDownClass()
+
+
+class DmpyTests(_DmpySharedDeviceTestCase):
+    """ Tests that only read the state of the dmpytest0 device.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # A task that has run, but returned no device data.
+        cls.empty_dmt = dm.DmTask(dm.DM_DEVICE_VERSION)
+        cls.empty_dmt.run()
+        super(DmpyTests, cls).setUpClass()
+
+    #
+    # Dmpy module tests.
+    #
+
+    def test_is_dm_major(self):
+        # Assert that invalid dm major numbers return False.
+        self.assertFalse(dm.is_dm_major(0))
+        self.assertFalse(dm.is_dm_major(1))
+        self.assertFalse(dm.is_dm_major(-1))
+        # Assert that valid dm major numbers return True.
+        self.assertTrue(dm.is_dm_major(_get_dm_major()))
+
+    def test_update_nodes(self):
+        pass  # FIXME: test with fake /dev and udev disabled.
+
+    def test_mknodes(self):
+        pass  # FIXME: test with fake /dev and udev disabled.
+
+    def test_dump_memory(self):
+        # FIXME: test with custom logging fn?
+        pass
+
     def test_cookie_supported(self):
         # Assert that the library returns the expected value of cookie_supported
         # depending on the library major/minor version values.
-        import dmpy as dm
         (major, minor, patch) = map(int, dm.driver_version().split("."))
         if major >= 4 and minor >=15:
             self.assertTrue(dm.cookie_supported())
@@ -427,7 +724,6 @@ class DmpyTests(unittest.TestCase):
     def test_udev_create_cookie(self):
         # Assert that a new cookie, with non-zero value is created following a
         # call to dmpy.udev_create_cookie().
-        import dmpy as dm
         cookie = dm.udev_create_cookie()
         self.assertTrue(cookie)
         self.assertTrue(cookie.value)
@@ -440,25 +736,21 @@ class DmpyTests(unittest.TestCase):
         # it's unlikely that anyone running the suite is using a kernel old
         # enough to fail the test. Users of RHEL5, or older builds of RHEL6
         # and RHEL7 will fail this test.
-        import dmpy as dm
         self.assertTrue(dm.message_supports_precise_timestamps())
 
     def test_stats_driver_supports_precise(self):
         # Assert that dm.stats_driver_supports_precise() returns True.
         # FIXME: see test_message_supports_precise_timestamps.
-        import dmpy as dm
         self.assertTrue(dm.stats_driver_supports_precise())
 
     def test_stats_driver_supports_histogram(self):
         # Assert that dm.stats_driver_supports_histogram() returns True.
         # FIXME: see test_message_supports_precise_timestamps.
-        import dmpy as dm
         self.assertTrue(dm.stats_driver_supports_histogram())
 
     def test_stats_all_programs(self):
         # Assert that the dmpy.STATS_ALL_PROGRAMS constant exists and has
         # the expected value.
-        import dmpy as dm
         self.assertFalse(dm.STATS_ALL_PROGRAMS)
         self.assertEqual(dm.STATS_ALL_PROGRAMS, "")
 
@@ -467,212 +759,234 @@ class DmpyTests(unittest.TestCase):
     #
 
     def test_dm_task_types_all_new(self):
-        # test creation of each defined DM_DEVICE_* task type
-        import dmpy as dm
-        task_types = [
-            dm.DM_DEVICE_CREATE,
-            dm.DM_DEVICE_RELOAD,
-            dm.DM_DEVICE_REMOVE,
-            dm.DM_DEVICE_REMOVE_ALL,
-            dm.DM_DEVICE_SUSPEND,
-            dm.DM_DEVICE_RESUME,
-            dm.DM_DEVICE_INFO,
-            dm.DM_DEVICE_DEPS,
-            dm.DM_DEVICE_RENAME,
-            dm.DM_DEVICE_VERSION,
-            dm.DM_DEVICE_STATUS,
-            dm.DM_DEVICE_TABLE,
-            dm.DM_DEVICE_WAITEVENT,
-            dm.DM_DEVICE_LIST,
-            dm.DM_DEVICE_CLEAR,
-            dm.DM_DEVICE_MKNODES,
-            dm.DM_DEVICE_LIST_VERSIONS,
-            dm.DM_DEVICE_TARGET_MSG,
-            dm.DM_DEVICE_SET_GEOMETRY
-        ]
-        for ttype in task_types:
-            dmt = dm.DmTask(ttype)
+        # test creation of each defined DM_DEVICE_* task type, and release
+        # each task before creating the next so that DmTask_dealloc() runs
+        # for every type.
+        DmTask = dm.DmTask
+        for ttype in _ALL_TASK_TYPES:
+            with self.subTest(ttype=ttype):
+                dmt = DmTask(ttype)
+                del dmt
+
+    def test_dm_task_run_threads(self):
+        # Assert that DmTask.run() can be called concurrently from several
+        # threads, each with its own task, and that every run succeeds.
+        versions = []
+
+        def run_version():
+            dmt = dm.DmTask(dm.DM_DEVICE_VERSION)
+            dmt.run()
+            versions.append(dmt.get_driver_version())
+
+        threads = [Thread(target=run_version) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(versions), len(threads))
+        self.assertEqual(len(set(versions)), 1)
+
+    def test_dm_task_run_threads_udev_wait_lib_release(self):
+        # Assert that DmTask.run() can be called concurrently with
+        # DmCookie.udev_wait() and lib_release() from other threads, and
+        # that every run succeeds.
+        errors = []
+
+        def run_info():
+            try:
+                for i in range(8):
+                    dmt = dm.DmTask(dm.DM_DEVICE_INFO)
+                    dmt.set_name(self.dmpytest0)
+                    dmt.run()
+            except OSError as e:
+                errors.append(e)
+
+        def run_resume_udev_wait():
+            try:
+                dmt = dm.DmTask(dm.DM_DEVICE_RESUME)
+                dmt.set_name(self.dmpytest0)
+                _run_task_udev(dmt, "Failed to resume device.")
+            except OSError as e:
+                errors.append(e)
+
+        def lib_release():
+            for i in range(8):
+                dm.lib_release()
+
+        threads = []
+        for i in range(4):
+            threads.append(Thread(target=run_info))
+            threads.append(Thread(target=run_resume_udev_wait))
+            threads.append(Thread(target=lib_release))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_dm_task_run_threads_setters(self):
+        # Assert that library settings can be changed and read back while
+        # DmTask.run() is executing in other threads, and that every run
+        # succeeds.
+        self.addCleanup(dm.set_uuid_prefix, dm.get_uuid_prefix())
+        self.addCleanup(dm.set_name_mangling_mode,
+                        dm.get_name_mangling_mode())
+        prefixes = ("QUX-", "LVM-")
+        modes = (dm.STRING_MANGLING_NONE, dm.STRING_MANGLING_AUTO)
+        errors = []
+        seen = []
+
+        def run_info():
+            try:
+                for i in range(8):
+                    dmt = dm.DmTask(dm.DM_DEVICE_INFO)
+                    dmt.set_name(self.dmpytest0)
+                    dmt.run()
+            except OSError as e:
+                errors.append(e)
+
+        def set_settings():
+            for i in range(8):
+                dm.set_uuid_prefix(prefixes[i % 2])
+                dm.set_name_mangling_mode(modes[i % 2])
+                seen.append(dm.get_uuid_prefix())
+
+        threads = []
+        for i in range(4):
+            threads.append(Thread(target=run_info))
+            threads.append(Thread(target=set_settings))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(all(prefix in prefixes for prefix in seen))
 
     def test_dm_task_type_invalid_new(self):
         # test that creation of an invalid DmTask type fails.
-        import dmpy as dm
         dmt = None
         with self.assertRaises(TypeError) as cm:
             dmt = dm.DmTask(2323)
 
-    def _test_empty_task_method_raises(self, method):
-        # Issue a DM_DEVICE_VERSION (which returns nothing but the driver
-        # version), and then attempt to call `method`, which should be the
-        # name of a `DmTask` method that raises `TypeError` when no data
-        # is present.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_VERSION)
-        dmt.run()
-        runnable = getattr(dmt, method)
-        self.assertTrue(runnable)
-        self.assertRaises(TypeError, runnable)
-
-    def test_empty_get_name_raises(self):
-        # dm_task_get_name() returns the name from the results of an ioctl.
-        # If no ioctl has been peformed (or if the ioctl did not return a
-        # device name), then attempting to call dm_task_get_name() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_name")
-
-    def test_empty_get_info_raises(self):
-        # dm_task_get_info() returns the info from the results of an ioctl.
-        # If no ioctl has been peformed (or if the ioctl did not return a
-        # device info), then attempting to call dm_task_get_info() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_info")
-
-    def test_empty_get_deps_raises(self):
-        # dm_task_get_deps() returns the deps from the results of an ioctl.
-        # If no ioctl has been peformed (or if the ioctl did not return
-        # device deps), then attempting to call dm_task_get_deps() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_deps")
-
-    def test_empty_get_uuid_raises(self):
-        # dm_task_get_uuid() returns the uuid from the results of an ioctl.
-        # If no ioctl has been peformed (or if the ioctl did not return
-        # device uuid), then attempting to call dm_task_get_uuid() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_uuid")
-
-    def test_empty_get_message_response_raises(self):
-        # dm_task_get_message() returns the message from the results of an
-        # ioctl. If no ioctl has been peformed (or if the ioctl did not return
-        # device message), then attempting to call dm_task_get_message() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_message_response")
-
-    def test_empty_get_names_raises(self):
-        # dm_task_get_names() returns the names from the results of an ioctl.
-        # If no ioctl has been peformed (or if the ioctl did not return
-        # device names), then attempting to call dm_task_get_names() will
-        # trigger a segmentation fault. The Python bindings need to detect
-        # this and return the Py_None type.
-        self._test_empty_task_method_raises("get_names")
+    def test_empty_task_methods_raise(self):
+        # Methods that return the results of an ioctl must not call the
+        # corresponding libdm getter if the ioctl did not return that data:
+        # doing so will trigger a segmentation fault. The Python bindings
+        # need to detect this and raise TypeError. A DM_DEVICE_VERSION task
+        # returns nothing but the driver version, so every one of these
+        # methods should raise.
+        for method in ("get_name", "get_info", "get_deps", "get_uuid",
+                       "get_message_response", "get_names",
+                       "get_names_buffer", "get_targets"):
+            with self.subTest(method=method):
+                with self.assertRaises(TypeError):
+                    getattr(self.empty_dmt, method)()
 
     def test_get_name_list_and_check_types(self):
         # We don't really care what devices are present - just that we get
         # the expected list of 3-tuples with (str, int, int) types.
         #
         # Fail the test if no devices are found.
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_LIST)
         dmt.run()
         names = dmt.get_names()
         self.assertTrue(len(names))
-        for name in names:
-            self.assertEqual(type(name[0]), str)  # name
-            self.assertEqual(type(name[1]), int)  # major
-            self.assertEqual(type(name[2]), int)  # minor
+        # (name, major, minor)
+        self.assertTrue(all(isinstance(n[0], str) and isinstance(n[1], int)
+                            and isinstance(n[2], int) for n in names))
 
-    def test_set_newname_name_ok(self):
+    def test_get_names_buffer_matches_get_names(self):
+        # Assert that the columnar name buffer holds the same devices, in
+        # the same order, as the list returned by DmTask.get_names().
+        dmt = dm.DmTask(dm.DM_DEVICE_LIST)
+        dmt.run()
+        names = dmt.get_names()
+        (name_buf, majors, minors) = dmt.get_names_buffer()
+        self.assertEqual(majors.typecode, "I")
+        self.assertEqual(minors.typecode, "I")
+        buf_names = [n.decode('utf-8') for n in name_buf.split(b"\0")[:-1]]
+        self.assertEqual(list(zip(buf_names, majors, minors)), names)
+
+    def test_get_names_buffer_major_minor(self):
+        # Assert that the major and minor columns of the name buffer hold
+        # the device numbers of the test device.
+        dev_path = join(_dev_mapper, self.dmpytest0)
+        (major, minor) = _get_major_minor_from_stat(dev_path)
+        dmt = dm.DmTask(dm.DM_DEVICE_LIST)
+        dmt.run()
+        (name_buf, majors, minors) = dmt.get_names_buffer()
+        buf_names = [n.decode('utf-8') for n in name_buf.split(b"\0")[:-1]]
+        index = buf_names.index(self.dmpytest0)
+        self.assertEqual(majors[index], major)
+        self.assertEqual(minors[index], minor)
+        self.assertEqual(len(majors), len(buf_names))
+        self.assertEqual(len(minors), len(buf_names))
+
+    def test_set_newname(self):
         # Assert that a valid newname can be set via DmTask.set_newname()
-        # on a DmTask(DM_DEVICE_RENAME) task.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dm_name_ok = (DM_NAME_LEN - 1) * "A"
-        self.assertTrue(dmt.set_newname(dm_name_ok))
-
-    def test_set_newname_null_name(self):
-        # Assert that TypeError is raised when name is NULL.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dm_name_null = None
-        with self.assertRaises(TypeError) as cm:
-            dmt.set_newname(dm_name_null)
-
-    def test_set_newname_empty_name(self):
-        # Assert that ValueError is raised when name is "".
-        import dmpy as dm
+        # on a DmTask(DM_DEVICE_RENAME) task, and that invalid names raise
+        # TypeError (name is NULL) or ValueError (name is "", contains '/',
+        # or len(name) > (DM_NAME_LEN - 1)).
         dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dm_name_empty = ""
-        with self.assertRaises(ValueError) as cm:
-            dmt.set_newname(dm_name_empty)
-
-    def test_set_newname_name_has_slash(self):
-        # Assert that ValueError is raised when name contains '/'
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dm_name_has_slash = "/qux"
-        with self.assertRaises(ValueError) as cm:
-            dmt.set_newname(dm_name_has_slash)
-
-    def test_set_newname_name_too_long(self):
-        # Assert that ValueError is raised when len(name) > (DM_NAME_LEN - 1).
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dm_name_too_long = DM_NAME_LEN * "A"
-        with self.assertRaises(ValueError) as cm:
-            dmt.set_newname(dm_name_too_long)
+        newnames = [
+            (_NAME_OK, None),
+            (None, TypeError),
+            ("", ValueError),
+            ("/qux", ValueError),
+            (_NAME_TOO_LONG, ValueError)
+        ]
+        for (newname, exc) in newnames:
+            with self.subTest(newname=newname):
+                if exc is None:
+                    self.assertTrue(dmt.set_newname(newname))
+                else:
+                    with self.assertRaises(exc) as cm:
+                        dmt.set_newname(newname)
 
     def test_task_set_get_name(self):
         # Assert that `DmTask.set_name()` sets the dm name for a DM_DEVICE_INFO
         # ioctl, and returns the correct device information by checking
         # `DmTask.get_name()`.
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.dmpytest0)
         dmt.run()
         self.assertEqual(self.dmpytest0, dmt.get_name())
 
-    def test_task_get_info(self):
-        # Assert that a non-NULL DmInfo object is returned following a
-        # successful DM_DEVICE_INFO ioctl.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
-        dmt.set_name(self.dmpytest0)
-        dmt.run()
-        info = dmt.get_info()
-        self.assertTrue(info)
-
-    def test_task_info_fields_present(self):
-        # Assert that the info.exists flag is non-zero for a valid device, and
-        # that the dmpytest0 device has an active table, and is read-write.
-        import dmpy as dm
+    def test_task_info_bundle(self):
+        # Assert that a successful DM_DEVICE_INFO ioctl returns a non-NULL
+        # DmInfo object, that the info.exists flag is non-zero for a valid
+        # device, that the dmpytest0 device has an active table and is
+        # read-write, and that the returned UUID string matches the stored
+        # value. All of these are checked against the results of one ioctl.
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.dmpytest0)
         dmt.run()
         info = dmt.get_info()
-        self.assertTrue(info.exists)
-        self.assertTrue(info.live_table)
-        self.assertFalse(info.read_only)
+        with self.subTest("info"):
+            self.assertTrue(info)
+        with self.subTest("exists"):
+            self.assertTrue(info.exists)
+        with self.subTest("live_table"):
+            self.assertTrue(info.live_table)
+        with self.subTest("read_only"):
+            self.assertFalse(info.read_only)
+        with self.subTest("uuid"):
+            self.assertEqual(dmt.get_uuid(), self.dmpytest0_uuid)
 
     def test_task_info_fields_nodev(self):
         # Assert that the info.exists flag is zero for a non-existent device.
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.nodev)
         dmt.run()
         info = dmt.get_info()
         self.assertFalse(info.exists)
 
-    def test_get_uuid(self):
-        # Get the device UUID with a DM_DEVICE_INFO ioctl, and assert that
-        # the command succeeds, and that the returned UUID string matches
-        # the stored value.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
-        dmt.set_name(self.dmpytest0)
-        dmt.run()
-        self.assertEqual(dmt.get_uuid(), self.dmpytest0_uuid)
-
     def test_get_deps(self):
         # Assert that a deps list is returned following a DM_DEVICE_DEPS
         # command, and that the major/minor number(s) of the dependencies
         # are as expected.
-        import dmpy as dm
-        # Stat the device for comparison
-        (maj_stat, min_stat) = _get_major_minor_from_stat(self.loop0[0])
+        # Compare with the loop device numbers from setUpClass()
+        (maj_stat, min_stat) = self.loop0_dev
         dmt = dm.DmTask(dm.DM_DEVICE_DEPS)
         dmt.set_name(self.dmpytest0)
         dmt.run()
@@ -682,104 +996,29 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(deps[0][0], maj_stat)
         self.assertEqual(deps[0][1], min_stat)
 
-    def test_set_message_run_response(self):
-        # Assert that setting a message succeeds, and that the ioctl runs
-        # successfully and gives the expected response.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_TARGET_MSG)
-        # Use a '@stats_create' as the message type - it will always succeed
-        # on any target and system with stats support.
+    def test_get_targets(self):
+        # Assert that a DM_DEVICE_TABLE of the test device returns its
+        # single linear target, mapping the whole of the loop device.
+        dmt = dm.DmTask(dm.DM_DEVICE_TABLE)
         dmt.set_name(self.dmpytest0)
-        message = "@stats_create 0+%d /1" % self.test_dev_size_sectors
-        self.assertTrue(dmt.set_message(message))
         dmt.run()
-        region_id = dmt.get_message_response()
-        self.assertTrue(int(region_id) >= 0)
+        targets = dmt.get_targets()
+        self.assertEqual(targets, [(0, self.test_dev_size_sectors, "linear",
+                                    "%d:%d 0" % self.loop0_dev)])
 
-    def test_set_newname_run_get_name(self):
-        # Assert that setting a new name succeeds, and that the ioctl runs
-        # successfully and returns the new name.
-        import dmpy as dm
-        newname = "dmpytest1"
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dmt.set_name(self.dmpytest0)
-        dmt.set_newname(newname)
-        dmt.run()
-        self.dmpytest0 = newname  # for tearDown()
-        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
-        dmt.set_name(newname)
-        dmt.run()
-        self.assertEqual(dmt.get_name(), newname)
-
-    def test_set_newuuid_with_no_uuid(self):
-        # Assert that we can set a new UUID for a device that has none,
-        # and that the new UUID is returned as expected.
-        import dmpy as dm
-        # We need a device with no UUID set.
-        _remove_dm_device(self.dmpytest0)
-        dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
-        dmpyuuidtest0 = "dmpyuuidtest0"
-        self.dmpytest0 = dmpyuuidtest0  # for tearDown()
-        dmt.set_name(dmpyuuidtest0)
-        dmt.run()
-
-        # Wait for udev to catch up
-        self.udev_settle()
-
-        # Generate a new UUID and apply it to the test device with a
-        # DM_DEVICE_RENAME task.
-        newuuid = _new_uuid()
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dmt.set_name(self.dmpytest0)
-        # Assert that the new UUID is set.
-        self.assertTrue(dmt.set_newuuid(newuuid))
-        dmt.run()
-
-        # Get a DM_DEVICE_INFO of the device to compare.
-        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
-        dmt.set_name(self.dmpytest0)
-        dmt.run()
-
-        # Assert that the retrieved UUID matches.
-        self.assertEqual(dmt.get_uuid(), newuuid)
-
-    def test_newuuid_with_uuid_set_fails(self):
-        # Assert that attempting to set a UUID on an active device that
-        # already has one set raises an exception.
-        import dmpy as dm
-
-        # Generate a new UUID and apply it to the test device with a
-        # DM_DEVICE_RENAME task.
-        newuuid = _new_uuid()
-        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
-        dmt.set_name(self.dmpytest0)
-
-        # Assert that the new UUID is set: this should succeed, and the
-        # subsequent dmt.run() should raise an exception based on the
-        # errno set by the task ioctl.
-        self.assertTrue(dmt.set_newuuid(newuuid))
-
-        with self.assertRaises(OSError) as cm:
-            dmt.run()
-
-        self.assertEqual(dmt.get_errno(), 22)  # EINVAL
-
-    def test_task_get_driver_version(self):
-        # Assert that we can obtain the driver version from a task, and
-        # that the result matches that obtained from dmsetup.
-        import dmpy as dm
+    def test_get_targets_without_table_or_status_raises(self):
+        # Assert that get_targets() on a task that returns neither table
+        # nor status data names both kinds of data in the error.
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.dmpytest0)
         dmt.run()
-        _dmsetup_driver_version = _get_driver_version_from_dmsetup()
-        _driver_version = dmt.get_driver_version()
-        self.assertTrue(_driver_version)
-        self.assertEqual(_dmsetup_driver_version, _driver_version)
+        with self.assertRaises(TypeError) as cm:
+            dmt.get_targets()
+        self.assertIn("table or status", str(cm.exception))
 
     def test_task_set_major_and_set_minor(self):
         # Send a DM_DEVICE_INFO task by major and minor number, and assert
         # that the expected device name is returned.
-        import dmpy as dm
         dev_path = join(_dev_mapper, self.dmpytest0)
         (major, minor) = _get_major_minor_from_stat(dev_path)
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
@@ -791,7 +1030,6 @@ class DmpyTests(unittest.TestCase):
     def test_task_set_major_minor(self):
         # Send a DM_DEVICE_INFO task by major and minor number, and assert
         # that the expected device name is returned.
-        import dmpy as dm
         dev_path = join(_dev_mapper, self.dmpytest0)
         (major, minor) = _get_major_minor_from_stat(dev_path)
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
@@ -814,7 +1052,6 @@ class DmpyTests(unittest.TestCase):
     def test_task_get_errno(self):
         # Run a DM_DEVICE_INFO ioctl for a non-existent device, and assert
         # that the errno returned by DmTask.get_errno() is 6 (ENXIO).
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.nodev)
         dmt.run()
@@ -823,7 +1060,6 @@ class DmpyTests(unittest.TestCase):
     def test_task_set_sector(self):
         # Assert that setting a message succeeds, and that the ioctl runs
         # successfully and gives the expected response.
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_TARGET_MSG)
         dmt.set_name(self.dmpytest0)
         dmt.set_message("@stats_list")
@@ -832,19 +1068,9 @@ class DmpyTests(unittest.TestCase):
         response = dmt.get_message_response()
         self.assertEqual(response, "")
 
-    def test_task_no_flush(self):
-        # Assert that setting noflush on a DM_DEVICE_SUSPEND task succeeds.
-        # FIXME: no testing of the flag's behaviour is done.
-        import dmpy as dm
-        dmt = dm.DmTask(dm.DM_DEVICE_SUSPEND)
-        dmt.set_name(self.dmpytest0)
-        self.assertTrue(dmt.no_flush())
-        dmt.run()
-
     def test_task_no_open_count(self):
         # Assert that setting no_open_count on a DM_DEVICE_INFO task succeeds,
         # and that the resulting task open count is zero.
-        import dmpy as dm
         dmt = dm.DmTask(dm.DM_DEVICE_INFO)
         dmt.set_name(self.dmpytest0)
         self.assertTrue(dmt.no_open_count())
@@ -877,7 +1103,6 @@ class DmpyTests(unittest.TestCase):
 
     def test_task_set_geometry(self):
         # Assert that setting the geometry strings succeeds,
-        import dmpy as dm
         geometry = ("62260", "255", "63", "64")
         dmt = dm.DmTask(dm.DM_DEVICE_SET_GEOMETRY)
         self.assertTrue(dmt.set_geometry(*geometry))
@@ -895,13 +1120,10 @@ class DmpyTests(unittest.TestCase):
     def test_task_create_single_linear_target_udev(self):
         # Attempt to create a simple device with a single, linear target,
         # and assert that the device node exists, and that the device
-        # table (as reported by dmsetup) matches the expected table.
-        import dmpy as dm
+        # table (as reported by DM_DEVICE_TABLE) matches the expected table.
         # Use a new device name - we will create and destroy it during
         # the test.
-        dmpytest1 = "dmpytest1"
-        loop_minor = self.loop_minor(self.loop0[0])
-        expected_table = "0 2048 linear 7:%d 0" % loop_minor
+        dmpytest1 = _unique_name("dmpytest1")
         dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
         dmt.set_name(dmpytest1)
         cookie = dm.DmCookie()
@@ -918,8 +1140,8 @@ class DmpyTests(unittest.TestCase):
         # Assert that the device node exists
         self.assertTrue(exists(join(_dev_mapper, dmpytest1)))
 
-        table = _get_table_from_dmsetup(dmpytest1)
-        self.assertEqual(table, expected_table)
+        table = _get_table(dmpytest1)
+        self.assertEqual(table, self.expected_linear_table)
 
         # Remove the device and its node
         dmt = dm.DmTask(dm.DM_DEVICE_REMOVE)
@@ -937,13 +1159,11 @@ class DmpyTests(unittest.TestCase):
     def test_task_create_single_linear_target_no_udev(self):
         # Attempt to create a simple device with a single, linear target,
         # and assert that the device node exists, and that the device
-        # table (as reported by dmsetup) matches the expected table.
-        import dmpy as dm
+        # table (as reported by DM_DEVICE_TABLE) matches the expected table.
         # Use a new device name - we will create and destroy it during
         # the test.
-        dmpytest1 = "dmpytest1"
-        loop_minor = self.loop_minor(self.loop0[0])
-        expected_table = "0 2048 linear 7:%d 0" % loop_minor
+        dmpytest1 = _unique_name("dmpytest1")
+        self.addCleanup(dm.udev_set_sync_support, dm.udev_get_sync_support())
         dm.udev_set_sync_support(0)
         dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
         dmt.set_name(dmpytest1)
@@ -958,8 +1178,8 @@ class DmpyTests(unittest.TestCase):
         # Assert that the device node exists
         self.assertTrue(exists(join(_dev_mapper, dmpytest1)))
 
-        table = _get_table_from_dmsetup(dmpytest1)
-        self.assertEqual(table, expected_table)
+        table = _get_table(dmpytest1)
+        self.assertEqual(table, self.expected_linear_table)
 
         # Remove the device and its node
         dmt = dm.DmTask(dm.DM_DEVICE_REMOVE)
@@ -971,7 +1191,6 @@ class DmpyTests(unittest.TestCase):
 
         # Assert that the device node no longer exists
         self.assertFalse(exists(join(_dev_mapper, dmpytest1)))
-        dm.udev_set_sync_support(1)
 
     #
     # Cookie tests
@@ -980,7 +1199,6 @@ class DmpyTests(unittest.TestCase):
     def test_new_cookie_not_ready(self):
         # Create a new cookie, assert that it is not ready, and then
         # destroy it.
-        import dmpy as dm
         cookie = dm.udev_create_cookie()
         self.assertFalse(cookie.ready)
         cookie.udev_wait()
@@ -988,7 +1206,6 @@ class DmpyTests(unittest.TestCase):
     def test_cookie_ready_after_wait(self):
         # Create a new cookie, wait on it, and assert that it becomes
         # ready following the call to cookie.udev_wait().
-        import dmpy as dm
         cookie = dm.udev_create_cookie()
         self.assertFalse(cookie.ready)
         self.assertTrue(cookie.udev_wait())
@@ -997,7 +1214,6 @@ class DmpyTests(unittest.TestCase):
     def test_cookie_multiple_wait(self):
         # Create a new cookie, wait on it, and assert that a further attempt
         # to call udev_wait() raises a ValueError exception.
-        import dmpy as dm
         cookie = dm.udev_create_cookie()
         self.assertFalse(cookie.ready)
         self.assertTrue(cookie.udev_wait())
@@ -1005,26 +1221,6 @@ class DmpyTests(unittest.TestCase):
         with self.assertRaises(ValueError) as cm:
             cookie.udev_wait()
 
-    def test_cookie_wait_immediate(self):
-        # Create a new cookie, wait on it, and assert that it becomes ready.
-        import dmpy as dm
-        _remove_dm_device(self.dmpytest0)
-        dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
-        dmt.set_name(self.dmpytest0)
-        cookie = dm.udev_create_cookie()
-        self.assertFalse(cookie.ready)
-        dmt.set_cookie(cookie)
-        dmt.add_target(0, self.test_dev_size_sectors,
-                       "linear", "%s 0" % self.loop0[0])
-        dmt.run()
-
-        cookie.udev_wait(immediate=True)
-        while not cookie.ready:
-            cookie.udev_wait(immediate=True)
-            sleep(_udev_wait_delay)
-
-        self.assertTrue(cookie.ready)
-
     #
     # DmStats tests
     #
@@ -1032,7 +1228,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_program_id(self):
         # Assert that creating a DmStats handle with program_id=None
         # returns a valid object.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         self.assertTrue(dms.__init__)
         self.assertEqual(type(dms), dm.DmStats)
@@ -1040,7 +1235,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_all_programs(self):
         # Assert that creating a DmStats handle with dm.STATS_ALL_PROGRAMS
         # returns a valid object.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.__init__)
         self.assertEqual(type(dms), dm.DmStats)
@@ -1048,7 +1242,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_no_program_id(self):
         # Assert that creating a DmStats handle with program_id=None
         # returns a valid object.
-        import dmpy as dm
         dms = dm.DmStats(None)
         self.assertTrue(dms.__init__)
         self.assertEqual(type(dms), dm.DmStats)
@@ -1056,7 +1249,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_bind_name(self):
         # Assert that creating a DmStats handle and binding it to a name via
         # the name= keword argument returns a valid object.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertTrue(dms.__init__)
         self.assertEqual(type(dms), dm.DmStats)
@@ -1064,7 +1256,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_no_program_id_bind_name(self):
         # Assert that creating a DmStats handle with program_id=None
         # and a name= keyword argument returns a valid object.
-        import dmpy as dm
         dms = dm.DmStats(None, name=self.dmpytest0)
         self.assertTrue(dms.__init__)
         self.assertEqual(type(dms), dm.DmStats)
@@ -1072,53 +1263,45 @@ class DmpyTests(unittest.TestCase):
     def test_stats_create_multiple_bind_raises(self):
         # Assert that attempting to pass multiple device binding kwargs
         # raises a TypeError exception.
-        import dmpy as dm
         with self.assertRaises(TypeError) as cm:
             dm.DmStats(self.program_id, name="foo", uuid="qux")
 
     def test_stats_bind_name_none(self):
         # Assert that attempting to bind a NULL name raises TypeError.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         with self.assertRaises(TypeError) as cm:
             dms.bind_name(None)
 
     def test_stats_bind_name_empty(self):
         # Assert that attempting to bind an empty name raises ValueError.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         with self.assertRaises(ValueError) as cm:
             dms.bind_name("")
 
     def test_stats_bind_name_valid(self):
         # Assert that attempting to bind a valid name succeeds.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         self.assertTrue(dms.bind_name(self.dmpytest0))
 
     def test_stats_bind_uuid_none(self):
         # Assert that attempting to bind a NULL uuid raises TypeError.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         with self.assertRaises(TypeError) as cm:
             dms.bind_uuid(None)
 
     def test_stats_bind_uuid_empty(self):
         # Assert that attempting to bind an empty uuid raises ValueError.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         with self.assertRaises(ValueError) as cm:
             dms.bind_uuid("")
 
     def test_stats_bind_uuid_valid(self):
         # Assert that attempting to bind a valid uuid succeeds.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         self.assertTrue(dms.bind_uuid(_new_uuid()))
 
     def test_stats_bind_devno_valid(self):
         # Assert that attempting to bind a valid devno succeeds.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         # FIXME: generate a valid DM major/minor pair.
         self.assertTrue(dms.bind_devno(253, 0))
@@ -1126,7 +1309,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_new_has_no_regions(self):
         # Assert that a newly created / bound stats handle returns zero
         # regions.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.__init__)
         self.assertFalse(dms.nr_regions())
@@ -1134,7 +1316,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_new_has_no_groups(self):
         # Assert that a newly created / bound stats handle returns zero
         # groups.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.__init__)
         self.assertFalse(dms.nr_groups())
@@ -1142,7 +1323,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_new_has_no_areas(self):
         # Assert that a newly created / bound stats handle returns zero
         # areas.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.__init__)
         self.assertFalse(dms.nr_areas())
@@ -1150,21 +1330,18 @@ class DmpyTests(unittest.TestCase):
     def test_stats_not_present_region_is_not_present(self):
         # Assert that a non-existent region_id returns False when passed
         # to DmStats.region_present().
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertFalse(dms.region_present(-1))
 
     def test_stats_new_handle_region_has_no_areas(self):
         # Assert that a newly created / bound stats handle returns zero
         # areas.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.__init__)
         self.assertFalse(dms.region_nr_areas(0))
 
     def test_stats_new_handle_no_group_present(self):
         # Assert that groups are not present in a newly created DmStats object.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertFalse(dms.group_present(0))
         self.assertFalse(dms.group_present(1))
@@ -1173,7 +1350,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_set_get_sampling_interval(self):
         # Assert that setting a sampling interval is raises no error, and that
         # the set value is returned by a subsequent get.
-        import dmpy as dm
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS)
         self.assertTrue(dms.set_sampling_interval(0.5))
         self.assertEqual(dms.get_sampling_interval(), 0.5)
@@ -1181,7 +1357,6 @@ class DmpyTests(unittest.TestCase):
     def test_stats_set_none_program_id_no_allow_empty_raises(self):
         # Assert that attempting to set None as the program_id fails if the
         # allow_empty flag is not given.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         with self.assertRaises(ValueError) as cm:
             dms.set_program_id(None)
@@ -1191,22 +1366,178 @@ class DmpyTests(unittest.TestCase):
     def test_stats_set_none_program_id_with_allow_empty(self):
         # Assert that attempting to set None as the program_id fails if the
         # allow_empty flag is not given.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         dms.set_program_id(None, allow_empty=True)
         dms.set_program_id("", allow_empty=True)
 
     def test_stats_set_program_id(self):
         # Assert that setting a valid program_id succeeds.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id)
         self.assertTrue(dms.set_program_id("qux"))
 
+
+class DmpyDeviceTests(_DmpyLoopTestCase):
+    """ Tests that rename, remove, or suspend the dmpytest0 device: it is
+        re-created for each test.
+    """
+
+    def setUp(self):
+        uuid = _new_uuid()
+        dev_size = self.test_dev_size_bytes
+        self.dmpytest0_uuid = uuid
+        self.dmpytest0 = _create_linear_device(self.loop0[0],
+                                               dev_size, uuid=uuid)
+
+    def tearDown(self):
+        if (self.dmpytest0):
+            _remove_dm_device(self.dmpytest0)
+
+    #
+    # DmTask tests.
+    #
+
+    def test_set_newname_run_get_name(self):
+        # Assert that setting a new name succeeds, and that the ioctl runs
+        # successfully and returns the new name.
+        newname = _unique_name("dmpytest1")
+        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
+        dmt.set_name(self.dmpytest0)
+        dmt.set_newname(newname)
+        _run_task_udev(dmt, "Failed to rename device.")
+        self.dmpytest0 = newname  # for tearDown()
+        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
+        dmt.set_name(newname)
+        dmt.run()
+        self.assertEqual(dmt.get_name(), newname)
+
+    def test_set_newuuid_with_no_uuid(self):
+        # Assert that we can set a new UUID for a device that has none,
+        # and that the new UUID is returned as expected.
+        # We need a device with no UUID set.
+        _remove_dm_device(self.dmpytest0)
+        dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
+        dmpyuuidtest0 = _unique_name("dmpyuuidtest0")
+        self.dmpytest0 = dmpyuuidtest0  # for tearDown()
+        dmt.set_name(dmpyuuidtest0)
+        _run_task_udev(dmt, "Failed to create device.")
+
+        # Generate a new UUID and apply it to the test device with a
+        # DM_DEVICE_RENAME task.
+        newuuid = _new_uuid()
+        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
+        dmt.set_name(self.dmpytest0)
+        # Assert that the new UUID is set.
+        self.assertTrue(dmt.set_newuuid(newuuid))
+        _run_task_udev(dmt, "Failed to set device UUID.")
+
+        # Get a DM_DEVICE_INFO of the device to compare.
+        dmt = dm.DmTask(dm.DM_DEVICE_INFO)
+        dmt.set_name(self.dmpytest0)
+        dmt.run()
+
+        # Assert that the retrieved UUID matches.
+        self.assertEqual(dmt.get_uuid(), newuuid)
+
+    def test_newuuid_with_uuid_set_fails(self):
+        # Assert that attempting to set a UUID on an active device that
+        # already has one set raises an exception.
+
+        # Generate a new UUID and apply it to the test device with a
+        # DM_DEVICE_RENAME task.
+        newuuid = _new_uuid()
+        dmt = dm.DmTask(dm.DM_DEVICE_RENAME)
+        dmt.set_name(self.dmpytest0)
+
+        # Assert that the new UUID is set: this should succeed, and the
+        # subsequent dmt.run() should raise an exception based on the
+        # errno set by the task ioctl.
+        self.assertTrue(dmt.set_newuuid(newuuid))
+
+        with self.assertRaises(OSError) as cm:
+            dmt.run()
+
+        self.assertEqual(dmt.get_errno(), 22)  # EINVAL
+
+    def test_task_no_flush(self):
+        # Assert that setting noflush on a DM_DEVICE_SUSPEND task succeeds.
+        # FIXME: no testing of the flag's behaviour is done.
+        dmt = dm.DmTask(dm.DM_DEVICE_SUSPEND)
+        dmt.set_name(self.dmpytest0)
+        self.assertTrue(dmt.no_flush())
+        _run_task_udev(dmt, "Failed to suspend device.")
+
+    def test_set_read_ahead(self):
+        # Assert that the read-ahead set on a DM_DEVICE_CREATE task is
+        # applied to the new device.
+        _remove_dm_device(self.dmpytest0)
+        dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
+        dmt.set_name(self.dmpytest0)
+        dmt.add_target(0, self.test_dev_size_sectors,
+                       "linear", "%s 0" % self.loop0[0])
+        self.assertTrue(dmt.set_read_ahead(512, 0))
+        _run_task_udev(dmt, "Failed to create device.")
+        dev_path = join(_dev_mapper, self.dmpytest0)
+        self.assertEqual(_read_ahead_from_sysfs(dev_path), 512)
+
+    #
+    # Cookie tests
+    #
+
+    def test_cookie_wait_immediate(self):
+        # Create a new cookie, wait on it, and assert that it becomes ready.
+        _remove_dm_device(self.dmpytest0)
+        dmt = dm.DmTask(dm.DM_DEVICE_CREATE)
+        dmt.set_name(self.dmpytest0)
+        cookie = dm.udev_create_cookie()
+        self.assertFalse(cookie.ready)
+        dmt.set_cookie(cookie)
+        dmt.add_target(0, self.test_dev_size_sectors,
+                       "linear", "%s 0" % self.loop0[0])
+        dmt.run()
+
+        # Exercise the non-blocking path once, then block until udev has
+        # processed the event rather than polling.
+        cookie.udev_wait(immediate=True)
+        if not cookie.ready:
+            cookie.udev_wait()
+
+        self.assertTrue(cookie.ready)
+
+
+class DmpyStatsTests(_DmpySharedDeviceTestCase):
+    """ Tests that create stats regions on the dmpytest0 device: the
+        device is shared by the class, and the regions are removed after
+        each test.
+    """
+
+    def tearDown(self):
+        _remove_all_stats(self.dmpytest0)
+
+    #
+    # DmTask tests.
+    #
+
+    def test_set_message_run_response(self):
+        # Assert that setting a message succeeds, and that the ioctl runs
+        # successfully and gives the expected response.
+        dmt = dm.DmTask(dm.DM_DEVICE_TARGET_MSG)
+        # Use a '@stats_create' as the message type - it will always succeed
+        # on any target and system with stats support.
+        dmt.set_name(self.dmpytest0)
+        message = "@stats_create 0+%d /1" % self.test_dev_size_sectors
+        self.assertTrue(dmt.set_message(message))
+        dmt.run()
+        region_id = dmt.get_message_response()
+        self.assertTrue(int(region_id) >= 0)
+
+    #
+    # DmStats tests
+    #
+
     def test_stats_list(self):
         # Assert that listing an empty device yields an empty
         # DmStats object, and that the correct number of regions is
         # returned when listing a device with regions present.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertFalse(dms.list())
         self.assertEqual(len(dms), 0)
@@ -1224,14 +1555,12 @@ class DmpyTests(unittest.TestCase):
         # Assert that populating an empty device yields an empty
         # DmStats object, and that the correct number of regions is
         # returned when populating a device with regions present.
-        import dmpy as dm
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         with self.assertRaises(OSError) as cm:
             dms.populate()
         self.assertEqual(len(dms), 0)
 
     def test_stats_populate_unlisted_raises(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         # Attempting to populate a single region in an empty dm_stats handle
@@ -1243,7 +1572,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(len(dms), 0)
 
     def test_stats_populate_bogus_raises(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertTrue(dms.list())
@@ -1252,7 +1580,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(len(dms), 0)
 
     def test_stats_populate_one_region(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertTrue(dms.list())
@@ -1260,7 +1587,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(len(dms), 1)
 
     def test_stats_populate_all_regions(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertTrue(dms.populate())
@@ -1274,7 +1600,6 @@ class DmpyTests(unittest.TestCase):
         # Assert that listing an empty device yields an empty
         # DmStats object, and that the correct number of regions is
         # returned when listing a device with regions present.
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         self.assertTrue(dms.list())
@@ -1292,7 +1617,6 @@ class DmpyTests(unittest.TestCase):
         # DmStatsRegion, that depends on the parent DmStats' state, *after*
         # an invalidating DmStats operation, correctly causes the LookupError
         # exception to be raised.
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         dms.populate()
@@ -1307,7 +1631,6 @@ class DmpyTests(unittest.TestCase):
         # DmStatsRegion, that depends on the parent DmStats' state, *after*
         # an invalidating DmStats operation, correctly causes the LookupError
         # exception to be raised.
-        import dmpy as dm
         _create_stats(self.dmpytest0, nr_areas=1, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
         dms.populate()
@@ -1322,7 +1645,6 @@ class DmpyTests(unittest.TestCase):
     def test_dmstatsregion_precise_attr(self):
         # Assert that region precise_timestamps attributes have the expected
         # value following a list() or populate() operation.
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, precise=True, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
@@ -1336,7 +1658,6 @@ class DmpyTests(unittest.TestCase):
     def test_dmstatsregion_startlen_attr(self):
         # Assert that the start, and length attributes returned by a
         # DmStatsRegion object match those used to create it with dmstats.
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, start=1024,
                       length=512)
@@ -1352,8 +1673,16 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1].start, 1024)
         self.assertEqual(dms[1].len, 512)
 
+    def test_dmstatsregion_start_only_attr(self):
+        # Assert that a region created with a start and no length covers
+        # the remainder of the device.
+        _create_stats(self.dmpytest0, program_id=self.program_id, start=1024)
+        dms = dm.DmStats(self.program_id, name=self.dmpytest0)
+        dms.list()
+        self.assertEqual(dms[0].start, 1024)
+        self.assertEqual(dms[0].len, self.test_dev_size_sectors - 1024)
+
     def test_dmstatsregion_arealen_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, nr_areas=8)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
@@ -1365,7 +1694,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1].area_len, 256)
 
     def test_dmstatsregion_program_id_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id="qux")
         _create_stats(self.dmpytest0, program_id=self.program_id)
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS, name=self.dmpytest0)
@@ -1377,7 +1705,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1].program_id, self.program_id)
 
     def test_dmstatsregion_aux_data_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, aux_data="quxfoo")
         dms = dm.DmStats(dm.STATS_ALL_PROGRAMS, name=self.dmpytest0)
         dms.list(dm.STATS_ALL_PROGRAMS)
@@ -1386,7 +1713,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[0].aux_data, "quxfoo")
 
     def test_dmstatsarea_startofflen_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, nr_areas=8)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
@@ -1412,7 +1738,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1][1].offset, 256)
 
     def test_dmstatsarea_region_id_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, nr_areas=8)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
@@ -1424,7 +1749,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1].region_id, 1)
 
     def test_dmstatsarea_area_id_attr(self):
-        import dmpy as dm
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, nr_areas=8)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)
@@ -1450,7 +1774,6 @@ class DmpyTests(unittest.TestCase):
         self.assertEqual(dms[1][7].area_id, 7)
 
     def test_dmstatsarea_region_attr(self):
-        import dmpy as dm
         import gc
         _create_stats(self.dmpytest0, program_id=self.program_id)
         _create_stats(self.dmpytest0, program_id=self.program_id, nr_areas=8)
@@ -1467,7 +1790,6 @@ class DmpyTests(unittest.TestCase):
     # Counter tests
     #
     def test_dmstats_counter_names_get_values(self):
-        import dmpy as dm
         import gc
         _create_stats(self.dmpytest0, program_id=self.program_id)
         dms = dm.DmStats(self.program_id, name=self.dmpytest0)